@@ -1,26 +1,8 @@
 import os
-import heapq
 
-# Define movement directions and commands
-directions = {'UP': (-1, 0), 'DOWN': (1, 0), 'LEFT': (0, -1), 'RIGHT': (0, 1)}
-key_door_map = {'b': 'B', 'r': 'R', 'g': 'G', 'y': 'Y'}  # Maps keys to doors
-
-# Load grid from file
-def load_grid(filename):
-    with open(filename, 'r') as file:
-        grid = [list(line.strip()) for line in file.readlines()]
-    agent_pos = None
-    human_pos = None
-    keys = {}
-    for i, row in enumerate(grid):
-        for j, cell in enumerate(row):
-            if cell == 'm':
-                agent_pos = (i, j)
-            elif cell == 'h':
-                human_pos = (i, j)
-            elif cell in key_door_map.keys():
-                keys[cell] = (i, j)  # store key locations
-    return grid, agent_pos, human_pos, keys
+from components import components_for
+from grid import directions, key_door_map, load_grid
+from planner import planner_for
 
 # Update human position based on action
 def update_human_position(human_pos, action, detail):
@@ -78,42 +60,15 @@ def load_human_actions(filename, human_pos):
                 print("Warning: Unrecognized action line:", line)
     return actions, human_pos
 
-# Heuristic function for A*
-def heuristic(start, end):
-    return abs(start[0] - end[0]) + abs(start[1] - end[1])
-
 # A* pathfinding function
 def find_path(grid, start, goal, collected_keys):
-    rows, cols = len(grid), len(grid[0])
-    open_list = []
-    closed_set = set()
-    heapq.heappush(open_list, (heuristic(start, goal), start, []))  # (f_cost, position, path)
-
-    while open_list:
-        f_cost, current_pos, path = heapq.heappop(open_list)
-        if current_pos == goal:
-            return path
-
-        closed_set.add(current_pos)
-
-        for dir_name, (dx, dy) in directions.items():
-            neighbor = (current_pos[0] + dx, current_pos[1] + dy)
-            if 0 <= neighbor[0] < rows and 0 <= neighbor[1] < cols:
-                if neighbor in closed_set:
-                    continue
-                cell = grid[neighbor[0]][neighbor[1]]
-
-                if cell == 'W':
-                    continue  # Wall
-
-                if cell in key_door_map.values() and cell.lower() not in collected_keys:
-                    continue  # Locked door
-
-                new_path = path + [(dir_name, neighbor)]
-                heapq.heappush(open_list, (f_cost + 1 + heuristic(neighbor, goal), neighbor, new_path))
-
-    print("No path found from", start, "to", goal)
-    return []
+    path = []
+    # Walled-off goals are rejected without a search
+    if components_for(grid).reachable(start, goal, collected_keys):
+        path = planner_for(grid).find_path(start, goal, collected_keys)
+    if not path and start != goal:
+        print("No path found from", grid.pos(start), "to", grid.pos(goal))
+    return path
 
 # Simulation function with updated human position tracking
 def simulate(grid, agent_pos, human_pos, actions, keys, result_file):
@@ -121,7 +76,7 @@ def simulate(grid, agent_pos, human_pos, actions, keys, result_file):
     instruction_number = 1
 
     with open(result_file, "w") as f:
-        f.write(f"My_position {agent_pos}\n")
+        f.write(f"My_position {grid.pos(agent_pos)}\n")
         for action, detail in actions:
             if action == 'Move':
                 human_pos = update_human_position(human_pos, action, detail)
@@ -129,25 +84,39 @@ def simulate(grid, agent_pos, human_pos, actions, keys, result_file):
 
             elif action == 'Request':
                 key = detail
-                if key in keys:
-                    key_pos = keys[key]
-                    path_to_key = find_path(grid, agent_pos, key_pos, collected_keys)
+                # Only instances the agent can walk to are considered, by
+                # the length of the path it would take to them
+                components = components_for(grid)
+                planner = planner_for(grid)
+
+                def reachable_cost(pos):
+                    if not components.reachable(agent_pos, pos, collected_keys):
+                        return None
+                    return planner.distance(agent_pos, pos, collected_keys)
+
+                key_pos = keys.nearest(key, agent_pos, reachable_cost) if key in keys else None
+                path_to_key = find_path(grid, agent_pos, key_pos, collected_keys) if key_pos is not None else []
+                # Never pick up a key the agent did not get to
+                if key_pos is not None and (path_to_key or agent_pos == key_pos):
                     for direction, pos in path_to_key:
-                        f.write(f"Move {direction} {pos}\n")
+                        f.write(f"Move {direction} {grid.pos(pos)}\n")
                     collected_keys.add(key)
                     f.write(f"Pick_up_{key.upper()}_key\n")
                     agent_pos = key_pos
+                    keys.remove(key, key_pos)
 
                     # Track latest human position dynamically
-                    path_to_human = find_path(grid, agent_pos, human_pos, collected_keys)
+                    path_to_human = find_path(grid, agent_pos, grid.index(human_pos), collected_keys)
                     f.write(f"Locate_human: {human_pos}\n")
                     f.write("Move_to_Human:\n")
                     for direction, pos in path_to_human:
-                        f.write(f"Move {direction} {pos}\n")
-                    agent_pos = human_pos
+                        f.write(f"Move {direction} {grid.pos(pos)}\n")
+                    agent_pos = grid.index(human_pos)
 
                     f.write(f"Drop_{key.upper()}_key\n")
                     collected_keys.remove(key)
+                elif key in keys:
+                    print(f"Key '{key}' cannot be reached from {grid.pos(agent_pos)}.")
                 else:
                     print(f"Key '{key}' not found in the grid.")
 
@@ -170,7 +139,7 @@ def simulate(grid, agent_pos, human_pos, actions, keys, result_file):
 # Main execution function
 def main(grid_file, actions_file):
     grid, agent_pos, human_pos, keys = load_grid(grid_file)
-    actions, human_pos = load_human_actions(actions_file, human_pos)
+    actions, human_pos = load_human_actions(actions_file, grid.pos(human_pos))
 
     test_case_number = os.path.splitext(os.path.basename(grid_file))[0].split('_')[0]
     result_file = os.path.join("Results", f"{test_case_number}_result.txt")
@@ -187,7 +156,7 @@ if __name__ == "__main__":
 # Main execution function
 def main(grid_file, actions_file):
     grid, agent_pos, human_pos, keys = load_grid(grid_file)
-    actions, human_pos = load_human_actions(actions_file, human_pos)
+    actions, human_pos = load_human_actions(actions_file, grid.pos(human_pos))
 
     # Extract test case number safely
     filename = os.path.splitext(os.path.basename(grid_file))[0]
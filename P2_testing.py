@@ -1,223 +1,404 @@
-import os
 import heapq
-import re
-
-# Define movement directions and commands
-directions = {'UP': (-1, 0), 'DOWN': (1, 0), 'LEFT': (0, -1), 'RIGHT': (0, 1)}
-key_door_map = {'b': 'B', 'r': 'R', 'g': 'G', 'y': 'Y'}  # Maps keys to doors
-
-# Load grid from file
-def load_grid(filename):
-    with open(filename, 'r') as file:
-        grid = [list(line.strip()) for line in file.readlines()]
-    agent_pos = None
-    human_pos = None
-    keys = {}
-    for i, row in enumerate(grid):
-        for j, cell in enumerate(row):
-            if cell == 'm':
-                agent_pos = (i, j)
-            elif cell == 'h':
-                human_pos = (i, j)
-            elif cell in key_door_map:
-                keys[cell] = (i, j)  # store key locations
-    return grid, agent_pos, human_pos, keys
+import os
+import sys
+import time
+
+import instrument
+from actions import (ACTION_NAMES, DIRECTION_NAMES, MOVE, PICK_UP, REQUEST, REQUEST_BATCH, UNLOCK,
+                     UNLOCK_NEAREST, batch_requests, instructions, parse_actions)
+from components import components_for
+from distances import DistanceCache
+from dstar import IncrementalPlanner
+from grid import PASSABLE, directions, key_door_map, key_mask, load_grid, load_grid_mmap
+from hpa import HierarchicalPlanner
+from jps import JumpPointPlanner
+from keyed import KeyedPlanner
+from planner import PathPlanner, planner_for
+from sinks import SINKS
+from snapshot import load_fresh, save_snapshot, snapshot_path
+from tours import TourPlanner
+
+# Planners selectable from the command line
+PLANNERS = {'fields': DistanceCache, 'astar': PathPlanner, 'jps': JumpPointPlanner,
+            'dstar': IncrementalPlanner, 'hpa': HierarchicalPlanner}
 
 # Function to update the human position
 def update_human_position(human_pos, action, direction, grid):
-    print("025")
     if action == 'Move':
-        print(f"Attempting to move human in direction: {direction}")
         dx, dy = directions[direction.upper()]
-        new_hx, new_hy = human_pos[0] + dx, human_pos[1] + dy
+        new_pos = human_pos + dx * grid.stride + dy
         # Check boundaries and obstacles
-        if 0 <= new_hx < len(grid) and 0 <= new_hy < len(grid[0]):
-            if grid[new_hx][new_hy] != 'W':
-                # Update the grid to reflect the new human position
-                grid[human_pos[0]][human_pos[1]] = '.'  # Clear old position
-                grid[new_hx][new_hy] = 'h'             # Set new position
-                human_pos = (new_hx, new_hy)
+        if grid.is_open(new_pos):
+            # Update the grid to reflect the new human position
+            grid.set_cell(human_pos, ord('.'))  # Clear old position
+            grid.set_cell(new_pos, ord('h'))    # Set new position
+            human_pos = new_pos
     return human_pos
 
-# Function to interpret the instructions
-def interpret_instructions(filename, human_pos, grid):
-    actions = []
-    with open(filename, 'r') as file:
-        for line in file:
-            line = line.strip()
-            if not line:
-                continue
-            # Split the line based on whitespace or special characters
-            parts = re.split(r'\s+|[:]', line)
-            if len(parts) < 2:
-                continue
-            if parts[0].startswith("Move"):
-                if len(parts) >= 2:
-                    action, direction = parts[0], parts[1].upper()
-                    # Update human position
-                    human_pos = update_human_position(human_pos, action, direction, grid)
-                    actions.append((action, direction))
-            elif parts[0].startswith("Instruction"):
-                instruction = ' '.join(parts[1:]).strip()
-                if "unlock" in instruction.lower():
-                    # Find the closest door to the updated human position
-                    closest_door, door_pos = find_closest_door(human_pos, grid)
-                    if closest_door:
-                        key_color = closest_door.lower()
-                        actions.append(('Request', key_color))
-                        actions.append(('Unlock', key_color))
-                else:
-                    # Handle other instructions if necessary
-                    key_color = instruction.split()[-2][0].lower()
-                    actions.append(('Request', key_color))
-            elif parts[0].startswith("Pick_up"):
-                if len(parts) >= 3:
-                    key_color = parts[2][0].lower()
-                    actions.append(('Pick_up', key_color))
-            elif parts[0].startswith("Unlock"):
-                if len(parts) >= 2:
-                    key_color = parts[1][0].lower()
-                    actions.append(('Unlock', key_color))
-    return actions, human_pos
-
-def find_closest_door(human_pos, grid):
-    rows, cols = len(grid), len(grid[0])
-    min_distance = float('inf')
-    closest_door = None
-    door_pos = None
-    for i in range(rows):
-        for j in range(cols):
-            cell = grid[i][j]
-            if cell in key_door_map.values():
-                distance = abs(human_pos[0] - i) + abs(human_pos[1] - j)
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_door = cell
-                    door_pos = (i, j)
-    return closest_door, door_pos
-
-# Heuristic function for A*
-def heuristic(start, end):
-    return abs(start[0] - end[0]) + abs(start[1] - end[1])
+# Find the door (of one color, if given) the human can walk to in the fewest
+# moves, ties going to the first door in row-major order. If the human can
+# reach none of them, fall back to the closest one by Manhattan distance.
+# The doors come from the component index, which also rules out the ones
+# the human cannot get next to; the search stops at the first door found.
+def find_closest_door(human_pos, grid, door=None):
+    components = components_for(grid)
+    doors = sorted(pos for pos in components.doors if not door or grid.cell(pos) == door)
+    if not doors:
+        return None, None
+    # Cells a door is entered from, when the human can get to them
+    human = components.label(human_pos, 0)
+    entries = {}
+    for pos in doors:
+        for _, step in grid.moves:
+            if components.label(pos + step, 0) == human:
+                entries.setdefault(pos + step, []).append(pos)
+    door_pos = _closest_entry(grid, human_pos, entries) if entries else None
+    if door_pos is None:
+        door_pos = min(doors, key=lambda pos: heuristic(human_pos, pos, grid.stride))
+    return grid.cell(door_pos), door_pos
 
-# A* pathfinding function
-def find_path(grid, start, goal, collected_keys):
-    rows, cols = len(grid), len(grid[0])
+# Search from start, without keys, for the closest entry; returns the first
+# door in row-major order entered from one at that distance. With a few
+# entries the search heads for the nearest of them by Manhattan distance,
+# with many it is breadth-first and one of them is bound to be close.
+def _closest_entry(grid, start, entries):
+    cells, size, stride = grid.cells, grid.size, grid.stride
+    passable = PASSABLE[0]
+    steps = [step for _, step in grid.moves]
+    targets = [divmod(idx, stride) for idx in entries] if len(entries) <= 16 else []
 
-    heap = [(0, start)]
-    costs = {start: 0}
-    parent_map = {start: None}
+    def estimate(idx):
+        if not targets:
+            return 0
+        row, col = divmod(idx, stride)
+        return min(abs(row - target_row) + abs(col - target_col) for target_row, target_col in targets)
 
+    costs = {start: 0}
+    heap = [(estimate(start), 0, start)]
+    best = None
+    found = []
     while heap:
-        _, current = heapq.heappop(heap)
-        if current == goal:
+        estimated, cost, idx = heapq.heappop(heap)
+        if best is not None and estimated > best:
             break
+        if cost > costs[idx]:
+            continue
+        if idx in entries:
+            # Entries are popped at their distance; collect every one at the first
+            best = cost
+            found.extend(entries[idx])
+            continue
+        for step in steps:
+            neighbor = idx + step
+            if 0 <= neighbor < size and passable[cells[neighbor]] and cost + 1 < costs.get(neighbor, size):
+                costs[neighbor] = cost + 1
+                heapq.heappush(heap, (cost + 1 + estimate(neighbor), cost + 1, neighbor))
+    return min(found) if found else None
+
+# Manhattan distance between two cells
+def heuristic(start, end, stride):
+    sx, sy = divmod(start, stride)
+    ex, ey = divmod(end, stride)
+    return abs(sx - ex) + abs(sy - ey)
 
-        for direction, (dx, dy) in directions.items():
-            nx, ny = current[0] + dx, current[1] + dy
-            if 0 <= nx < rows and 0 <= ny < cols and grid[nx][ny] != 'W':
-                cell = grid[nx][ny]
-                if cell in key_door_map.values() and cell.lower() not in collected_keys:
-                    continue  # Skip doors without keys
-                new_cost = costs[current] + 1
-                if (nx, ny) not in costs or new_cost < costs[(nx, ny)]:
-                    costs[(nx, ny)] = new_cost
-                    heapq.heappush(heap, (new_cost + heuristic((nx, ny), goal), (nx, ny)))
-                    parent_map[(nx, ny)] = (current, direction)
-
-    path = []
-    current = goal
-    while current != start:
-        if current not in parent_map:
-            return []  # No path
-        parent, direction = parent_map[current]
-        path.append((direction, current))
-        current = parent
-
-    return path[::-1]  # Reverse path
-    
-    
-
-# Simulation function with updated human position tracking
-def simulate(grid, agent_pos, human_pos, actions, keys, result_file):
+# A* pathfinding function
+def find_path(grid, start, goal, collected_keys):
+    if not components_for(grid).reachable(start, goal, collected_keys):
+        return []
+    return planner_for(grid).find_path(start, goal, collected_keys)
+
+# Simulation coroutine with updated human position tracking. Send it one
+# (opcode, argument) pair at a time; it writes the agent's response for that
+# action to sink before waiting for the next one.
+def simulation(grid, agent_pos, human_pos, keys, sink, planner=None):
+    if planner is None:
+        planner = PathPlanner(grid)
+    # Instrumentation is checked once here; when it is off the loop runs bare
+    tracer = instrument.recorder()
+    if tracer is not None:
+        planner = instrument.InstrumentedPlanner(planner, tracer)
     collected_keys = set()
-    print(f"Initial collected_keys: {collected_keys}")
     instruction_number = 1
+    keyed = None
+    tours = None
+
+    components = components_for(grid)
+    # Keys the agent picked up on the way to another key and still carries
+    held = set()
+    # Routes found while pricing a request, by (start, goal, key mask)
+    routes = {}
+
+    # Route from start to goal as (moves, pickups) without writing it, or None
+    # if there is none. When the doors in the way leave the planner without
+    # a route, the keyed planner fetches their keys on the way instead; pickups
+    # lists (index into moves, key, cell) for those, not for a key at the goal.
+    def route(start, goal, carried):
+        nonlocal keyed
+        leg = routes.get((start, goal, key_mask(carried)))
+        if leg is not None:
+            return leg
+        if components.reachable(start, goal, carried):
+            path = planner.find_path(start, goal, carried)
+            if path or start == goal:
+                return path, ()
+        if keyed is None:
+            keyed = KeyedPlanner(grid, keys)
+        plan = keyed.plan(start, goal, carried)
+        if plan is None:
+            return None
+        moves, pickups = plan
+        return moves, [pickup for pickup in pickups if pickup[2] != goal]
+
+    # Write a route and pick up the keys on the way. Returns how many moves were written.
+    def follow(moves, pickups):
+        written = 0
+        for i, key, idx in pickups:
+            sink.moves(moves[written:i + 1])
+            written = i + 1
+            keys.remove(key, idx)
+            collected_keys.add(key)
+            held.add(key)
+            sink.pick_up(key)
+        sink.moves(moves[written:])
+        return len(moves)
+
+    # Fetch the (key, cell) stops in order, then bring them and the held keys
+    # in delivered to the human. Every leg is planned before anything is
+    # written; returns the moves made, or None without writing anything if
+    # some leg has no route.
+    def trip(stops, delivered=()):
+        nonlocal agent_pos
+        carried = set(collected_keys)
+        position = agent_pos
+        legs = []
+        for key, goal in list(stops) + [(None, human_pos)]:
+            leg = route(position, goal, carried)
+            if leg is None:
+                return None
+            legs.append(leg)
+            carried.update(picked for _, picked, _ in leg[1])
+            if key is not None:
+                carried.add(key)
+            position = goal
+
+        moved = 0
+        for (key, key_pos), leg in zip(stops, legs):
+            moved += follow(*leg)
+            keys.remove(key, key_pos)
+            collected_keys.add(key)
+            sink.pick_up(key)
+        sink.locate_human(human_pos)
+        sink.move_to_human()
+        moved += follow(*legs[-1])
+        for key in [key for key, _ in stops] + list(delivered):
+            sink.drop(key)
+            collected_keys.discard(key)
+            held.discard(key)
+        agent_pos = human_pos
+        return moved
 
-    with open(result_file, "w") as f:
-        print('012') 
-        f.write(f"My_position {agent_pos}\n")
-        
-        for action, detail in actions:
-            print(f'013: Action: {action}, Detail: {detail}')
-            if action == 'Move':
-                print(f"Moving human to new position based on direction: {detail}")
-                human_pos = update_human_position(human_pos, action, detail, grid)
+    # Bring one key to the human: a held one straight away, else the instance
+    # with the cheapest fetch-and-deliver route. Nothing is written if the
+    # key cannot be brought.
+    def request(key):
+        key_pos = None
+        if key in held:
+            moved = trip((), (key,))
+        elif key in keys:
+            # Instances are priced nearest first and only until the rest are
+            # too far to be cheaper. An instance behind doors is priced with
+            # the detour for their keys, as route would take it. The legs
+            # found are kept for the trip to the instance chosen.
+            cheapest = None
+
+            def fetch_cost(pos):
+                nonlocal cheapest
+                to_key = route(agent_pos, pos, collected_keys)
+                if to_key is None:
+                    return None
+                # The way to the human is at least the Manhattan distance
+                if cheapest is not None and len(to_key[0]) + heuristic(pos, human_pos, grid.stride) >= cheapest:
+                    return None
+                carried = collected_keys | {key} | {picked for _, picked, _ in to_key[1]}
+                to_human = route(pos, human_pos, carried)
+                if to_human is None:
+                    return None
+                routes[(agent_pos, pos, key_mask(collected_keys))] = to_key
+                routes[(pos, human_pos, key_mask(carried))] = to_human
+                cost = len(to_key[0]) + len(to_human[0])
+                if cheapest is None or cost < cheapest:
+                    cheapest = cost
+                return cost
+
+            key_pos = keys.nearest(key, agent_pos, fetch_cost)
+            moved = trip(((key, key_pos),)) if key_pos is not None else None
+        else:
+            return
+        routes.clear()
+        if moved is None:
+            print(f"Warning: no route to bring the {key} key to the human at {grid.pos(human_pos)}",
+                  file=sys.stderr)
+        if tracer is not None:
+            tracer.event('request', key=key, key_pos=grid.pos(key_pos) if key_pos is not None else None,
+                         human_pos=grid.pos(human_pos), moves=moved)
+
+    sink.my_position(agent_pos)
+    while True:
+        op, arg = yield
+        if tracer is not None:
+            action = ACTION_NAMES[op]
+            started = time.perf_counter()
+        if op == UNLOCK_NEAREST:
+            # "Unlock this door": fetch the key of the door closest to
+            # where the human is now, then unlock it
+            closest_door, _ = find_closest_door(human_pos, grid)
+            if closest_door is None:
+                steps = ()
+            else:
+                key_code = ord(closest_door.lower())
+                steps = ((REQUEST, key_code), (UNLOCK, key_code))
+        elif op == REQUEST_BATCH:
+            # One trip for all the keys, unless some of them cannot be fetched
+            wanted = [chr(code) for code in arg if chr(code) in keys and chr(code) not in held]
+            if tours is None:
+                tours = TourPlanner(grid)
+            tour = tours.plan(agent_pos, human_pos, wanted, keys, collected_keys) if wanted else None
+            if tour is None:
+                steps = tuple((REQUEST, code) for code in arg)
+            else:
+                steps = ((REQUEST_BATCH, (tour[1], [chr(code) for code in arg if chr(code) in held])),)
+        else:
+            steps = ((op, arg),)
+
+        for op, arg in steps:
+            if op == MOVE:
+                human_pos = update_human_position(human_pos, 'Move', DIRECTION_NAMES[arg], grid)
                 #f.write(f"Human_position {human_pos}\n")
-            elif action == 'Request':
-                print('015')
-                key = detail
-                if key in keys:
-                    print('023')
-                    key_pos = keys[key]
-                    path_to_key = find_path(grid, agent_pos, key_pos, collected_keys)
-                    
-                    for direction, pos in path_to_key:
-                        f.write(f"Move {direction} {pos}\n")
-                    
-                    collected_keys.add(key)
-                    print(f"Collected key: {key}, collected_keys: {collected_keys}")
-                    f.write(f"Pick_up_{key.upper()}_key\n")
-                    agent_pos = key_pos
-
-                    # Track latest human position dynamically
-                    path_to_human = find_path(grid, agent_pos, human_pos, collected_keys)
-                    f.write(f"Locate_human: {human_pos}\n")
-                    f.write("Move_to_Human:\n")
-                    for direction, pos in path_to_human:
-                        f.write(f"Move {direction} {pos}\n")
-                    #agent_pos = human_pos
-
-                    f.write(f"Drop_{key.upper()}_key\n")
-                    collected_keys.remove(key)
-                    print(f"Dropped key: {key}, collected_keys: {collected_keys}")
-                    
+            elif op == REQUEST:
+                request(chr(arg))
+
+            elif op == REQUEST_BATCH:
+                stops, delivered = arg
+                moved = trip(stops, delivered)
+                if moved is None:
+                    # Some leg of the tour has no route after all: one trip per key
+                    for key in [key for key, _ in stops] + delivered:
+                        request(key)
+                elif tracer is not None:
+                    tracer.event('request_batch', keys=''.join(key for key, _ in stops) + ''.join(delivered),
+                                 human_pos=grid.pos(human_pos), moves=moved)
 
-            elif action == 'Pick_up':
-                print('016')
-                key = detail
+            elif op == PICK_UP:
+                key = chr(arg)
+                keys.remove(key, human_pos)
                 collected_keys.add(key)
-                print(f"Picked up key: {key}, collected_keys: {collected_keys}")
-                f.write(f"Pick_up_{key.upper()}_key\n")
+                sink.pick_up(key)
 
-            elif action == 'Unlock':
-                print('017')
-                key = detail
+            elif op == UNLOCK:
+                key = chr(arg)
                 if key in collected_keys:
-                    f.write(f"Unlock_{key.upper()}_door\n")
+                    sink.unlock(key)
                     collected_keys.remove(key)
-                    print(f"Unlocked door with key: {key}, collected_keys: {collected_keys}")
+                    held.discard(key)
+                    # Open the door of that color closest to the human
+                    _, door_pos = find_closest_door(human_pos, grid, key_door_map[key])
+                    if door_pos is not None:
+                        grid.set_cell(door_pos, ord('.'))
+                    if tracer is not None:
+                        tracer.event('unlock', key=key,
+                                     door_pos=grid.pos(door_pos) if door_pos is not None else None)
 
-            instruction_number += 1
-            print('018')
+        if tracer is not None:
+            tracer.add_time(f"action:{action}", time.perf_counter() - started)
+            tracer.count(f"actions:{action}")
+        instruction_number += 1
 
-# Main execution function
-def main(grid_file, actions_file):
-    print('021')
-    grid, agent_pos, human_pos, keys = load_grid(grid_file)
-    actions, human_pos = interpret_instructions(actions_file, human_pos, grid)
+# Simulate a compiled action program from start to end. With batch > 1,
+# up to that many consecutive requests are served by a single trip.
+def simulate(grid, agent_pos, human_pos, program, keys, result_file, planner=None, sink='text', batch=1):
+    if isinstance(sink, str):
+        sink = SINKS[sink](result_file, grid.stride)
+    stream = instructions(program)
+    if batch > 1:
+        stream = batch_requests(stream, batch)
+    with sink:
+        steps = simulation(grid, agent_pos, human_pos, keys, sink, planner)
+        next(steps)
+        for instruction in stream:
+            steps.send(instruction)
 
-    # Create output file based on the input file's name
+# Run one test case and write its result file
+def run_case(grid_file, actions_file, result_file, use_mmap=False, planner='astar', sink='text', batch=1,
+             snapshot=True, save=False):
+    # A snapshot made from the grid file as it is now replaces loading it
+    with instrument.timed('load'):
+        loaded = load_fresh(grid_file) if snapshot else None
+        if loaded is not None:
+            grid, agent_pos, human_pos, keys, fields = loaded
+        else:
+            grid, agent_pos, human_pos, keys = load_grid_mmap(grid_file) if use_mmap else load_grid(grid_file)
+            fields = {}
+    with instrument.timed('parse'):
+        program = parse_actions(actions_file)
+
+    planner = PLANNERS[planner](grid)
+    if isinstance(planner, DistanceCache):
+        # Fields are rooted at the agent, the keys and the doors, but only
+        # computed when a query needs them; a snapshot brings them ready made
+        planner.sources.update([agent_pos] + keys.instances() + grid.doors())
+        planner.fields.update(fields)
+        if save and loaded is None:
+            with instrument.timed('precompute'):
+                planner.precompute(list(planner.sources))
+    if save and loaded is None:
+        save_snapshot(snapshot_path(grid_file), grid, agent_pos, human_pos, keys, grid_file, planner)
+    with instrument.timed('simulate'):
+        simulate(grid, agent_pos, human_pos, program, keys, result_file, planner, sink, batch)
+
+
+# Result file of a test case, named after the grid file's test case number
+def result_path(grid_file, results_dir="Results", sink='text'):
     test_case_number = os.path.splitext(os.path.basename(grid_file))[0].split('_')[0]
-    result_file = os.path.join("Results", f"{test_case_number}_result.txt")
+    extension = 'bin' if sink == 'binary' else 'txt'
+    return os.path.join(results_dir, f"{test_case_number}_result.{extension}")
+
+
+# Main execution function
+def main(grid_file, actions_file, use_mmap=False, planner='astar', sink='text', batch=1, snapshot=True,
+         save=False):
+    # Create output file based on the input file's name
+    result_file = result_path(grid_file, sink=sink)
     os.makedirs("Results", exist_ok=True)  # Ensure Results directory exists
-    simulate(grid, agent_pos, human_pos, actions, keys, result_file)
-    
+    run_case(grid_file, actions_file, result_file, use_mmap, planner, sink, batch, snapshot, save)
+
 
 # Example usage
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 3:
-        print("Usage: python P2_testing.py <grid_file> <actions_file>")
-    else:
-        main(sys.argv[1], sys.argv[2])
+    import argparse
+    parser = argparse.ArgumentParser(prog="python P2_testing.py")
+    parser.add_argument("grid_file")
+    parser.add_argument("actions_file")
+    parser.add_argument("--mmap", action="store_true",
+                        help="memory-map the grid file instead of reading it line by line")
+    parser.add_argument("--planner", choices=sorted(PLANNERS), default='astar',
+                        help="path planner used for key requests (default: astar)")
+    parser.add_argument("--sink", choices=sorted(SINKS), default='text',
+                        help="result format: text, binary trace or null to discard (default: text)")
+    parser.add_argument("--batch", type=int, default=1, metavar="N",
+                        help="serve up to N consecutive key requests with one trip (default: 1, off)")
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="read the grid file even if a fresh snapshot of it exists")
+    parser.add_argument("--save-snapshot", action="store_true",
+                        help="save the loaded grid and its distance fields as a snapshot for later runs")
+    parser.add_argument("--trace", metavar="FILE.json",
+                        help="write counters, timers and trace events as JSON")
+    parser.add_argument("--profile", metavar="FILE.prof",
+                        help="write the timers in cProfile format, readable with pstats")
+    args = parser.parse_args()
+    tracer = instrument.enable() if args.trace or args.profile else None
+    main(args.grid_file, args.actions_file, use_mmap=args.mmap, planner=args.planner, sink=args.sink,
+         batch=args.batch, snapshot=not args.no_snapshot, save=args.save_snapshot)
+    if args.trace:
+        tracer.write_json(args.trace)
+    if args.profile:
+        tracer.write_pstats(args.profile)
@@ -0,0 +1,111 @@
+import re
+import sys
+from array import array
+
+from grid import KEY_COLORS
+
+# Opcodes of the compiled action stream. Every instruction is two bytes:
+# the opcode and its argument, a direction code for MOVE and a key letter
+# for the others. UNLOCK_NEAREST carries no argument; the door it refers to
+# ("unlock this door") is only known once the human has actually moved, so
+# simulate resolves it against the grid when it gets there.
+MOVE, REQUEST, PICK_UP, UNLOCK, UNLOCK_NEAREST = range(1, 6)
+# Several requests served by one trip; only produced by batch_requests, its
+# argument is the bytes of the requested key letters
+REQUEST_BATCH = 6
+ACTION_NAMES = {MOVE: 'Move', REQUEST: 'Request', PICK_UP: 'Pick_up', UNLOCK: 'Unlock',
+                UNLOCK_NEAREST: 'Unlock_nearest', REQUEST_BATCH: 'Request_batch'}
+
+# Direction codes, in the order of grid.moves
+DIRECTION_NAMES = ('UP', 'DOWN', 'LEFT', 'RIGHT')
+DIRECTION_CODES = {name.encode(): code for code, name in enumerate(DIRECTION_NAMES)}
+
+# One pattern for every line the legacy splitter understood, plus a direct
+# "Request: red" line for live producers. The bare Pick_up_RED_key /
+# Unlock_RED_door forms have no separator after the keyword and were always
+# ignored; they still are.
+ACTION_LINE = re.compile(rb'''\s*(?:
+      Move\S*\s+(?P<direction>(?i:up|down|left|right))\b
+    | Instruction\S*?[\s:][\s:]*(?P<text>.*\S)
+    | Request\S*?[\s:][\s:]*(?P<request>\w)
+    | Pick_up\S*?[\s:][\s:]*(?P<pick_up>\w)
+    | Unlock\S*?[\s:][\s:]*(?P<unlock>\w)
+    )''', re.VERBOSE)
+KEY_LETTERS = KEY_COLORS.encode()
+KEY_OPCODES = {'request': REQUEST, 'pick_up': PICK_UP, 'unlock': UNLOCK}
+
+
+# Key letter of a color word, or None if it names no key color
+def _key_letter(word):
+    letter = word[:1].lower()
+    return letter[0] if letter and letter in KEY_LETTERS else None
+
+
+# Compile one line of an action script into an (opcode, argument) pair.
+# Returns None for lines that carry no action; warnings name the line.
+def parse_line(line, name="action", number=0):
+    match = ACTION_LINE.match(line)
+    if match is None:
+        return None
+    kind = match.lastgroup
+    if kind == 'direction':
+        return MOVE, DIRECTION_CODES[match.group('direction').upper()]
+    if kind == 'text':
+        text = match.group('text')
+        if b'unlock' in text.lower():
+            return UNLOCK_NEAREST, 0
+        # "Can you pass me the red key?": the color is the second to last word
+        words = text.split()
+        letter = _key_letter(words[-2]) if len(words) >= 2 else None
+        if letter is None:
+            print(f"Warning: {name}:{number}: no key color in instruction: {text.decode()}", file=sys.stderr)
+            return None
+        return REQUEST, letter
+    letter = _key_letter(match.group(kind))
+    if letter is None:
+        print(f"Warning: {name}:{number}: unknown key color: {line.strip().decode()}", file=sys.stderr)
+        return None
+    return KEY_OPCODES[kind], letter
+
+
+# Compile a stream of byte lines one at a time, as they arrive
+def stream_actions(lines, name="action"):
+    for number, line in enumerate(lines, 1):
+        instruction = parse_line(line, name, number)
+        if instruction is not None:
+            yield instruction
+
+
+# Compile an action script into an array of (opcode, argument) byte pairs.
+# The file is read one line at a time, so only the compact array is kept.
+def parse_actions(filename):
+    program = array('B')
+    with open(filename, 'rb') as file:
+        for instruction in stream_actions(file, filename):
+            program.extend(instruction)
+    return program
+
+
+# Iterate over the (opcode, argument) pairs of a compiled program
+def instructions(program):
+    codes = iter(program)
+    return zip(codes, codes)
+
+
+# Merge runs of consecutive requests for different keys, up to limit of
+# them, into single REQUEST_BATCH instructions
+def batch_requests(instructions, limit):
+    pending = bytearray()
+    for op, arg in instructions:
+        if op == REQUEST and arg not in pending and len(pending) < limit:
+            pending.append(arg)
+            continue
+        if pending:
+            yield (REQUEST, pending[0]) if len(pending) == 1 else (REQUEST_BATCH, bytes(pending))
+            pending = bytearray()
+        if op == REQUEST:
+            pending.append(arg)
+        else:
+            yield op, arg
+    if pending:
+        yield (REQUEST, pending[0]) if len(pending) == 1 else (REQUEST_BATCH, bytes(pending))
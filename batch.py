@@ -0,0 +1,88 @@
+import argparse
+import contextlib
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from P2_testing import PLANNERS, result_path, run_case
+from sinks import SINKS
+
+GRID_PATTERN = re.compile(r'^(\d+)_grid\.txt$')
+HUMAN_PATTERN = re.compile(r'^(\d+)_human\.txt$')
+
+
+# Find every N_grid.txt with a matching N_human.txt below input_dir
+def discover_cases(input_dir):
+    grids, humans = {}, {}
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            match = GRID_PATTERN.match(name)
+            if match:
+                grids[int(match.group(1))] = os.path.join(root, name)
+            match = HUMAN_PATTERN.match(name)
+            if match:
+                humans[int(match.group(1))] = os.path.join(root, name)
+    missing = sorted(set(grids) ^ set(humans))
+    for number in missing:
+        print(f"Warning: test case {number} has no {'actions' if number in grids else 'grid'} file")
+    return [(number, grids[number], humans[number]) for number in sorted(set(grids) & set(humans))]
+
+
+# Run one case in a worker; debug output is discarded
+def run_one(case, results_dir, use_mmap, planner, sink, batch=1):
+    number, grid_file, actions_file = case
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            run_case(grid_file, actions_file, result_path(grid_file, results_dir, sink), use_mmap, planner, sink,
+                     batch)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return number, time.perf_counter() - start, error
+
+
+# Run every case, serially when workers is 1, and print a summary
+def run_batch(input_dir="Input_files", results_dir="Results", workers=None, use_mmap=False, planner='astar',
+              sink='text', batch=1):
+    cases = discover_cases(input_dir)
+    os.makedirs(results_dir, exist_ok=True)
+    start = time.perf_counter()
+    if workers == 1:
+        outcomes = [run_one(case, results_dir, use_mmap, planner, sink, batch) for case in cases]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_one, case, results_dir, use_mmap, planner, sink, batch) for case in cases]
+            outcomes = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    failures = 0
+    for number, seconds, error in outcomes:
+        if error:
+            failures += 1
+            print(f"Case {number}: FAILED after {seconds * 1000:.1f} ms ({error})")
+        else:
+            print(f"Case {number}: {seconds * 1000:.1f} ms")
+    rate = len(cases) / elapsed if elapsed > 0 else 0.0
+    print(f"{len(cases)} cases in {elapsed:.2f} s ({rate:.1f} cases/sec), {failures} failed")
+    return outcomes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python batch.py",
+                                     description="Run every N_grid.txt / N_human.txt pair in parallel")
+    parser.add_argument("--input-dir", default="Input_files")
+    parser.add_argument("--results-dir", default="Results")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU, 1 runs serially)")
+    parser.add_argument("--mmap", action="store_true",
+                        help="memory-map the grid files instead of reading them line by line")
+    parser.add_argument("--planner", choices=sorted(PLANNERS), default='astar',
+                        help="path planner used for key requests (default: astar)")
+    parser.add_argument("--sink", choices=sorted(SINKS), default='text',
+                        help="result format: text, binary trace or null to discard (default: text)")
+    parser.add_argument("--batch", type=int, default=1, metavar="N",
+                        help="serve up to N consecutive key requests with one trip (default: 1, off)")
+    args = parser.parse_args()
+    run_batch(args.input_dir, args.results_dir, args.workers, args.mmap, args.planner, args.sink, args.batch)
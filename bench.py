@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from grid import KEY_COLORS, key_door_map, load_grid, load_grid_mmap
+from actions import parse_actions
+from P2_testing import PLANNERS, simulate
+from sinks import NullSink
+
+COLOR_NAMES = {'b': 'blue', 'r': 'red', 'g': 'green', 'y': 'yellow'}
+DEFAULT_SIZES = [10, 50, 100, 500, 1000, 2000, 4000]
+
+
+# Generate a reproducible random maze as a list of row strings. Walls are
+# scattered with the given density; the agent, the human, keys and doors
+# are placed on distinct floor cells.
+def generate_maze(rows, cols, seed, wall_density=0.3, doors=4, keys=8):
+    rng = random.Random(seed)
+    # One random byte per cell: bytes below the threshold become walls
+    threshold = min(256, int(wall_density * 256))
+    table = bytes(ord('W') if byte < threshold else ord('.') for byte in range(256))
+    cells = bytearray(rng.randbytes(rows * cols).translate(table))
+
+    special = rng.sample(range(rows * cols), min(rows * cols, 2 + doors + keys))
+    cells[special[0]] = ord('m')
+    if len(special) > 1:
+        cells[special[1]] = ord('h')
+    for i, idx in enumerate(special[2:2 + keys]):
+        cells[idx] = ord(KEY_COLORS[i % len(KEY_COLORS)])
+    for i, idx in enumerate(special[2 + keys:]):
+        cells[idx] = ord(key_door_map[KEY_COLORS[i % len(KEY_COLORS)]])
+    return [cells[i * cols:(i + 1) * cols].decode() for i in range(rows)]
+
+
+# Generate a matching human action script: a random walk with key requests
+def generate_actions(seed, moves=40, requests=4):
+    rng = random.Random(seed)
+    lines = [f"Move {rng.choice(['UP', 'DOWN', 'LEFT', 'RIGHT'])}" for _ in range(moves)]
+    for _ in range(requests):
+        color = COLOR_NAMES[rng.choice(KEY_COLORS)]
+        lines.insert(rng.randrange(len(lines) + 1), f"Instruction: Can you pass me the {color} key?")
+    return lines
+
+
+# Write a generated case in the Input_files layout so batch.py can run it
+def write_case(directory, number, rows, actions):
+    grid_dir = os.path.join(directory, "Grid_configurations")
+    actions_dir = os.path.join(directory, "Human_actions")
+    os.makedirs(grid_dir, exist_ok=True)
+    os.makedirs(actions_dir, exist_ok=True)
+    grid_file = os.path.join(grid_dir, f"{number}_grid.txt")
+    actions_file = os.path.join(actions_dir, f"{number}_human.txt")
+    with open(grid_file, 'w', newline='') as file:
+        file.write('\r\n'.join(rows))
+    with open(actions_file, 'w') as file:
+        file.write('\n'.join(actions))
+    return grid_file, actions_file
+
+
+# Time fn and, in a second run, measure its peak traced memory
+def measure(fn, memory=True):
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+# Planner queries from the agent to every key and from every key to the human
+def planner_queries(agent_pos, human_pos, keys, limit):
+    queries = []
+    for key in KEY_COLORS:
+        for pos in keys.positions(key):
+            queries.append((agent_pos, pos, set()))
+            queries.append((pos, human_pos, {key}))
+    return queries[:limit]
+
+
+def bench_planner(name, grid_file, queries, memory):
+    grid, _, _, _ = load_grid(grid_file)
+
+    def run():
+        planner = PLANNERS[name](grid)
+        totals = {'expanded': 0, 'pushes': 0, 'found': 0, 'path_moves': 0}
+        for start, goal, collected_keys in queries:
+            path = planner.find_path(start, goal, collected_keys)
+            totals['expanded'] += planner.expanded
+            totals['pushes'] += planner.pushes
+            totals['found'] += bool(path) or start == goal
+            totals['path_moves'] += len(path)
+        return totals
+
+    totals, seconds, peak = measure(run, memory)
+    return dict(totals, planner=name, queries=len(queries), seconds=seconds, peak_bytes=peak)
+
+
+def bench_simulate(name, grid_file, actions_file, memory):
+    def run():
+        grid, agent_pos, human_pos, keys = load_grid(grid_file)
+        program = parse_actions(actions_file)
+        simulate(grid, agent_pos, human_pos, program, keys, None, PLANNERS[name](grid), NullSink())
+
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            _, seconds, peak = measure(run, memory)
+        finally:
+            sys.stdout = stdout
+    return {'planner': name, 'seconds': seconds, 'peak_bytes': peak}
+
+
+def bench_load(grid_file, memory):
+    results = []
+    for name, loader in (('load_grid', load_grid), ('load_grid_mmap', load_grid_mmap)):
+        _, seconds, peak = measure(lambda: loader(grid_file), memory)
+        results.append({'loader': name, 'seconds': seconds, 'peak_bytes': peak})
+    return results
+
+
+def run_benchmarks(sizes, seed=1, wall_density=0.3, doors=4, keys=8, planners=None, queries=20,
+                   memory=True, cases_dir=None):
+    planners = planners or list(PLANNERS)
+    report = {
+        'version': 1,
+        'python': platform.python_version(),
+        'seed': seed,
+        'wall_density': wall_density,
+        'doors': doors,
+        'keys': keys,
+        'sizes': [],
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        for number, size in enumerate(sizes, 1):
+            rows = generate_maze(size, size, seed + number, wall_density, doors, keys)
+            actions = generate_actions(seed + number)
+            grid_file, actions_file = write_case(cases_dir or scratch, number, rows, actions)
+
+            _, agent_pos, human_pos, key_index = load_grid(grid_file)
+            pairs = planner_queries(agent_pos, human_pos, key_index, queries)
+            entry = {
+                'rows': size,
+                'cols': size,
+                'load': bench_load(grid_file, memory),
+                'planners': [bench_planner(name, grid_file, pairs, memory) for name in planners],
+                'simulate': [bench_simulate(name, grid_file, actions_file, memory) for name in planners],
+            }
+            report['sizes'].append(entry)
+            for result, simulated in zip(entry['planners'], entry['simulate']):
+                print(f"{size}x{size} {result['planner']:>6}: {result['seconds'] * 1000:9.1f} ms, "
+                      f"{result['expanded']} expanded, {result['pushes']} pushes{megabytes(result)}; "
+                      f"simulate {simulated['seconds'] * 1000:.1f} ms{megabytes(simulated)}", file=sys.stderr)
+    return report
+
+
+# Peak traced memory for the summary lines, when it was measured
+def megabytes(result):
+    peak = result['peak_bytes']
+    return f", {peak / 2 ** 20:.1f} MB peak" if peak is not None else ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python bench.py",
+                                     description="Benchmark the loaders, planners and simulate on generated mazes")
+    parser.add_argument("--sizes", type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="side lengths of the square mazes (default: 10 to 4000)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--wall-density", type=float, default=0.3)
+    parser.add_argument("--doors", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=8)
+    parser.add_argument("--planners", nargs='+', choices=sorted(PLANNERS), default=None)
+    parser.add_argument("--queries", type=int, default=20, help="planner queries per maze")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak memory runs")
+    parser.add_argument("--cases-dir", help="keep the generated grid and action files in this directory")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.seed, args.wall_density, args.doors, args.keys, args.planners,
+                            args.queries, not args.no_memory, args.cases_dir)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
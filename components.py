@@ -0,0 +1,188 @@
+import re
+import weakref
+from bisect import bisect_right
+
+from grid import CELL_CLASS, DOOR, KEY, PASSABLE, WALL, key_mask
+
+# Runs of cells that can be entered without any key
+_CLOSED = bytes(byte for byte in range(256) if CELL_CLASS[byte] == WALL or DOOR <= CELL_CLASS[byte] < KEY)
+OPEN_RUN = re.compile(b'[^' + b''.join(b'\\x%02x' % byte for byte in _CLOSED) + b']+')
+
+
+# Connected components of the grid for every key set, so that a goal that
+# cannot be reached is rejected without a search. A union-find over the
+# horizontal runs of open cells gives the components with every door shut;
+# for a key set, a much smaller union-find joins those components through
+# the doors the keys open. Unlocking a door joins components in place.
+class Components:
+    def __init__(self, grid, state=None):
+        self.grid = grid
+        grid.listeners.append(self.cell_changed)
+        if state is None:
+            self.build()
+        else:
+            self.restore(*state)
+
+    def build(self):
+        grid = self.grid
+        cells, stride = grid.cells, grid.stride
+        self.parent = []  # union-find over run and door node ids
+        self.starts, self.ends, self.ids = [], [], []  # per row: the runs in order
+        for row in range(grid.rows):
+            begin = row * stride
+            starts, ends, ids = [], [], []
+            for match in OPEN_RUN.finditer(cells, begin, begin + grid.cols):
+                ids.append(len(self.parent))
+                self.parent.append(len(self.parent))
+                starts.append(match.start())
+                ends.append(match.end())
+            if row:
+                # Join the runs that overlap a run of the row above
+                above_starts, above_ends, above_ids = self.starts[-1], self.ends[-1], self.ids[-1]
+                i = j = 0
+                while i < len(above_ids) and j < len(ids):
+                    above_start, above_end = above_starts[i] + stride, above_ends[i] + stride
+                    if above_start < ends[j] and starts[j] < above_end:
+                        self._union(above_ids[i], ids[j])
+                    if above_end < ends[j]:
+                        i += 1
+                    else:
+                        j += 1
+            self.starts.append(starts)
+            self.ends.append(ends)
+            self.ids.append(ids)
+
+        self.doors = {}  # door cell -> (node id, key bit of its color)
+        self.door_mask = 0  # colors of the doors on the grid
+        for idx in grid.doors():
+            bit = 1 << (CELL_CLASS[cells[idx]] - DOOR)
+            self.doors[idx] = (len(self.parent), bit)
+            self.parent.append(len(self.parent))
+            self.door_mask |= bit
+        self.masks = {}  # key mask -> {component: component it is joined to}
+
+    # Everything restore needs, with every node pointing straight at its root
+    def state(self):
+        for node in range(len(self.parent)):
+            self._find(node)
+        return self.parent, self.starts, self.ends, self.ids, self.doors
+
+    # Adopt saved labels. The run and parent arrays may be views into a
+    # snapshot or shared with other grids; they are only copied when a cell
+    # change has to edit them. Unlocking edits the doors, so those are copied.
+    def restore(self, parent, starts, ends, ids, doors):
+        self.parent = parent
+        self.starts, self.ends, self.ids = starts, ends, ids
+        self.doors = dict(doors)
+        self.door_mask = 0
+        for _, bit in doors.values():
+            self.door_mask |= bit
+        self.masks = {}
+
+    def _find(self, node):
+        parent = self.parent
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a != b:
+            self.parent[a] = b
+
+    # Node id of the open run or door at idx, or None for a wall
+    def _node(self, idx):
+        if not 0 <= idx < self.grid.size:
+            return None
+        row = idx // self.grid.stride
+        if row >= len(self.ids):
+            return None
+        i = bisect_right(self.starts[row], idx) - 1
+        if i >= 0 and idx < self.ends[row][i]:
+            return self.ids[row][i]
+        door = self.doors.get(idx)
+        return door[0] if door is not None else None
+
+    # Components joined through the doors the keys in mask open
+    def _joined(self, mask):
+        joined = self.masks.get(mask)
+        if joined is None:
+            parent = {}
+
+            def find(node):
+                while parent.get(node, node) != node:
+                    node = parent[node]
+                return node
+
+            moves = [step for _, step in self.grid.moves]
+            for idx, (node, bit) in self.doors.items():
+                if not mask & bit:
+                    continue
+                for step in moves:
+                    other = self._node(idx + step)
+                    if other is None or (idx + step in self.doors and not mask & self.doors[idx + step][1]):
+                        continue
+                    a, b = find(self._find(node)), find(self._find(other))
+                    if a != b:
+                        parent[a] = b
+            joined = self.masks[mask] = {node: find(node) for node in parent}
+        return joined
+
+    # Component of idx when carrying the keys in mask; walls and shut doors
+    # are components of their own
+    def label(self, idx, mask):
+        node = self._node(idx)
+        if node is None:
+            return -2 - idx
+        door = self.doors.get(idx)
+        if door is not None and not mask & door[1]:
+            return -2 - idx
+        root = self._find(node)
+        return self._joined(mask & self.door_mask).get(root, root)
+
+    # False if goal certainly cannot be reached from start with these keys
+    def reachable(self, start, goal, collected_keys):
+        mask = key_mask(collected_keys)
+        return self.label(start, mask) == self.label(goal, mask)
+
+    # A cell that can now be entered without keys, e.g. an unlocked door,
+    # becomes a run of its own joined to its neighbors. Anything else could
+    # split a component, so the labelling starts over.
+    def cell_changed(self, idx):
+        grid = self.grid
+        if not PASSABLE[0][grid.cells[idx]]:
+            self.build()
+            return
+        if self.doors.pop(idx, None) is None and self._node(idx) is not None:
+            return  # Already open
+        row = idx // grid.stride
+        if not isinstance(self.parent, list):
+            self.parent = list(self.parent)
+        for runs in (self.starts, self.ends, self.ids):
+            if not isinstance(runs[row], list):
+                runs[row] = list(runs[row])
+        i = bisect_right(self.starts[row], idx)
+        node = len(self.parent)
+        self.parent.append(node)
+        self.starts[row].insert(i, idx)
+        self.ends[row].insert(i, idx + 1)
+        self.ids[row].insert(i, node)
+        for _, step in grid.moves:
+            other = self._node(idx + step)
+            if other is not None and idx + step not in self.doors:
+                self._union(node, other)
+        self.masks.clear()
+
+
+_components = weakref.WeakKeyDictionary()
+
+
+# Shared components of a grid, labelled on first use or restored from state
+def components_for(grid, state=None):
+    components = _components.get(grid)
+    if components is None:
+        components = _components[grid] = Components(grid, state)
+    return components
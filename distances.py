@@ -0,0 +1,194 @@
+from array import array
+
+from grid import CELL_CLASS, PASSABLE, WALL, key_mask
+
+try:
+    import numpy as np
+except ImportError:  # wavefront falls back to a plain Python BFS
+    np = None
+
+# Index of the opposite move in grid.moves (UP, DOWN, LEFT, RIGHT)
+OPPOSITE = (1, 0, 3, 2)
+
+
+# Breadth-first distances from one source plus the move that leads each
+# reached cell one step back towards the source
+class DistanceField:
+    def __init__(self, source, dist, toward, blocked, reached):
+        self.source = source
+        self.dist = dist        # -1 where the source cannot be reached
+        self.toward = toward    # index into grid.moves of the step towards the source
+        self.blocked = blocked  # doors the search bumped into
+        self.reached = reached  # number of cells reached
+
+    def distance(self, idx):
+        distance = self.dist[idx]
+        return distance if distance >= 0 else None
+
+    # Moves from idx to the source, or None if the source cannot be reached
+    def path_from(self, grid, idx):
+        if self.dist[idx] < 0:
+            return None
+        moves, toward, source = grid.moves, self.toward, self.source
+        path = []
+        while idx != source:
+            direction, step = moves[toward[idx]]
+            idx += step
+            path.append((direction, idx))
+        return path
+
+    # Moves from the source to idx, or None if idx cannot be reached
+    def path_to(self, grid, idx):
+        if self.dist[idx] < 0:
+            return None
+        moves, toward, source = grid.moves, self.toward, self.source
+        path = []
+        while idx != source:
+            back = toward[idx]
+            path.append((moves[OPPOSITE[back]][0], idx))
+            idx += moves[back][1]
+        path.reverse()
+        return path
+
+
+# Run a breadth-first search over the whole reachable region from source
+def bfs_field(grid, source, collected_keys):
+    cells, size = grid.cells, grid.size
+    passable = grid.passable(collected_keys)
+    steps = [(step, OPPOSITE[i]) for i, (_, step) in enumerate(grid.moves)]
+
+    dist = array('i', [-1]) * size
+    toward = bytearray(size)
+    blocked = set()
+    dist[source] = 0
+    frontier = [source]
+    distance = 0
+    reached = 0
+    while frontier:
+        reached += len(frontier)
+        distance += 1
+        next_frontier = []
+        for current in frontier:
+            for step, back in steps:
+                neighbor = current + step
+                if 0 <= neighbor < size and dist[neighbor] < 0:
+                    if passable[cells[neighbor]]:
+                        dist[neighbor] = distance
+                        toward[neighbor] = back
+                        next_frontier.append(neighbor)
+                    elif CELL_CLASS[cells[neighbor]] != WALL:
+                        blocked.add(neighbor)
+        frontier = next_frontier
+    return DistanceField(source, dist, toward, blocked, reached)
+
+
+# Breadth-first distances from every source at once, -1 where no source can
+# be reached. With NumPy each BFS level is a handful of array operations on
+# the frontier; the result is a NumPy int32 array, else an array('i').
+def wavefront(grid, sources, collected_keys=()):
+    if np is None:
+        return _wavefront_python(grid, sources, collected_keys)
+    size = grid.size
+    cells = np.frombuffer(grid.cells, dtype=np.uint8, count=size)
+    passable = np.frombuffer(PASSABLE[key_mask(collected_keys)], dtype=np.uint8)[cells].astype(bool)
+    steps = [step for _, step in grid.moves]
+
+    dist = np.full(size, -1, dtype=np.int32)
+    frontier = np.unique(np.asarray(sources, dtype=np.int64))
+    dist[frontier] = 0
+    slot = np.empty(size, dtype=np.int64)  # scratch space to drop duplicate neighbors
+    distance = 0
+    while frontier.size:
+        distance += 1
+        neighbors = np.concatenate([frontier + step for step in steps])
+        neighbors = neighbors[(neighbors >= 0) & (neighbors < size)]
+        neighbors = neighbors[passable[neighbors] & (dist[neighbors] < 0)]
+        # Keep one copy of every cell: the last write to its slot wins
+        order = np.arange(neighbors.size)
+        slot[neighbors] = order
+        frontier = neighbors[slot[neighbors] == order]
+        dist[frontier] = distance
+    return dist
+
+
+def _wavefront_python(grid, sources, collected_keys):
+    cells, size = grid.cells, grid.size
+    passable = grid.passable(collected_keys)
+    steps = [step for _, step in grid.moves]
+
+    dist = array('i', [-1]) * size
+    frontier = []
+    for source in sources:
+        if dist[source] < 0:
+            dist[source] = 0
+            frontier.append(source)
+    distance = 0
+    while frontier:
+        distance += 1
+        next_frontier = []
+        for current in frontier:
+            for step in steps:
+                neighbor = current + step
+                if 0 <= neighbor < size and dist[neighbor] < 0 and passable[cells[neighbor]]:
+                    dist[neighbor] = distance
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+    return dist
+
+
+# Distance fields per point of interest and key set. Fields are dropped
+# when a cell they reached or a door they were stopped by changes.
+class DistanceCache:
+    def __init__(self, grid):
+        self.grid = grid
+        self.fields = {}  # (source, key mask) -> DistanceField
+        self.sources = set()  # points of interest
+        self.expanded = 0  # cells reached by the searches of the last query
+        self.pushes = 0
+        grid.listeners.append(self.cell_changed)
+
+    # Compute the fields of every source for one key set up front
+    def precompute(self, sources, collected_keys=()):
+        for source in sources:
+            self.sources.add(source)
+            self.field(source, collected_keys)
+
+    def field(self, source, collected_keys):
+        cache_key = (source, key_mask(collected_keys))
+        field = self.fields.get(cache_key)
+        if field is None:
+            field = self.fields[cache_key] = bfs_field(self.grid, source, collected_keys)
+            self.expanded += field.reached
+        return field
+
+    # Field that answers a start-goal query: a cached one rooted at either
+    # end, else a new one rooted at whichever end is a point of interest
+    def _field_for(self, start, goal, collected_keys):
+        self.expanded = 0
+        mask = key_mask(collected_keys)
+        field = self.fields.get((goal, mask))
+        if field is not None:
+            return field, True
+        field = self.fields.get((start, mask))
+        if field is not None:
+            return field, False
+        if start in self.sources and goal not in self.sources:
+            return self.field(start, collected_keys), False
+        return self.field(goal, collected_keys), True
+
+    def distance(self, start, goal, collected_keys):
+        field, at_goal = self._field_for(start, goal, collected_keys)
+        return field.distance(start if at_goal else goal)
+
+    # Same contract as find_path: the moves from start to goal, or [] if unreachable
+    def find_path(self, start, goal, collected_keys):
+        field, at_goal = self._field_for(start, goal, collected_keys)
+        if at_goal:
+            return field.path_from(self.grid, start) or []
+        return field.path_to(self.grid, goal) or []
+
+    def cell_changed(self, idx):
+        stale = [cache_key for cache_key, field in self.fields.items()
+                 if field.dist[idx] >= 0 or idx in field.blocked]
+        for cache_key in stale:
+            del self.fields[cache_key]
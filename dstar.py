@@ -0,0 +1,206 @@
+import heapq
+from collections import OrderedDict
+
+from grid import PASSABLE, key_mask
+
+INF = float('inf')
+
+# Opposite of every direction name
+OPPOSITE = {'UP': 'DOWN', 'DOWN': 'UP', 'LEFT': 'RIGHT', 'RIGHT': 'LEFT'}
+
+
+# D* Lite search tree rooted at one cell. It holds the cost from every cell
+# it has settled to the root, so when the other end of the query moves, a
+# door opens or the key set changes only the affected cells are repaired.
+class DStarLite:
+    def __init__(self, grid, root, mask, start):
+        self.grid = grid
+        self.root = root
+        self.mask = mask
+        self.passable = PASSABLE[mask]
+        self.steps = [step for _, step in grid.moves]
+        self.start = start
+        self.km = 0
+        self.g = {}
+        self.rhs = {root: 0}
+        self.queue = []
+        self.queued = {}  # cell -> key of its live queue entry
+        self.expanded = 0
+        self.pushes = 0
+        self._push(root)
+
+    def _heuristic(self, a, b):
+        ar, ac = divmod(a, self.grid.stride)
+        br, bc = divmod(b, self.grid.stride)
+        return abs(ar - br) + abs(ac - bc)
+
+    def _key(self, cell):
+        best = min(self.g.get(cell, INF), self.rhs.get(cell, INF))
+        return (best + self._heuristic(self.start, cell) + self.km, best)
+
+    def _push(self, cell):
+        key = self._key(cell)
+        self.queued[cell] = key
+        heapq.heappush(self.queue, (key, cell))
+        self.pushes += 1
+
+    def _update(self, cell):
+        g, rhs = self.g, self.rhs
+        if cell != self.root:
+            cells, size, passable = self.grid.cells, self.grid.size, self.passable
+            best = INF
+            for step in self.steps:
+                neighbor = cell + step
+                if 0 <= neighbor < size and passable[cells[neighbor]]:
+                    cost = g.get(neighbor, INF) + 1
+                    if cost < best:
+                        best = cost
+            if best < INF:
+                rhs[cell] = best
+            else:
+                rhs.pop(cell, None)
+        if g.get(cell, INF) != rhs.get(cell, INF):
+            self._push(cell)
+        else:
+            self.queued.pop(cell, None)
+
+    def _neighbors(self, cell):
+        size = self.grid.size
+        return [cell + step for step in self.steps if 0 <= cell + step < size]
+
+    def _compute(self):
+        g, rhs, queue, queued = self.g, self.rhs, self.queue, self.queued
+        start = self.start
+        while queue:
+            key, cell = queue[0]
+            if queued.get(cell) != key:
+                heapq.heappop(queue)  # Superseded entry
+                continue
+            if key >= self._key(start) and rhs.get(start, INF) <= g.get(start, INF):
+                break
+            heapq.heappop(queue)
+            self.expanded += 1
+            new_key = self._key(cell)
+            if key < new_key:
+                self.queued[cell] = new_key
+                heapq.heappush(queue, (new_key, cell))
+                self.pushes += 1
+            elif g.get(cell, INF) > rhs.get(cell, INF):
+                g[cell] = rhs[cell]
+                del queued[cell]
+                for neighbor in self._neighbors(cell):
+                    self._update(neighbor)
+            else:
+                g.pop(cell, None)
+                for neighbor in self._neighbors(cell) + [cell]:
+                    self._update(neighbor)
+
+    # Move the free end of the tree; the queue keys stay valid through km
+    def move_start(self, start):
+        if start != self.start:
+            self.km += self._heuristic(self.start, start)
+            self.start = start
+
+    # A cell's passability changed: repair the cells that step into it
+    def cell_changed(self, cell):
+        for neighbor in self._neighbors(cell):
+            self._update(neighbor)
+
+    # Switch to another key set, repairing only the doors that changed
+    def set_mask(self, mask, doors):
+        if mask == self.mask:
+            return
+        old, new = self.passable, PASSABLE[mask]
+        self.mask, self.passable = mask, new
+        cells = self.grid.cells
+        for door in doors:
+            if old[cells[door]] != new[cells[door]]:
+                self.cell_changed(door)
+
+    # Cost from start to the root, or None if it cannot be reached
+    def distance(self, start):
+        self.move_start(start)
+        self._compute()
+        # start may be left underconsistent; its rhs is settled either way
+        cost = self.rhs.get(start, INF)
+        return cost if cost < INF else None
+
+    # Moves from start to the root, or None if it cannot be reached
+    def path_from(self, start):
+        if self.distance(start) is None:
+            return None
+        cells, size, passable, g = self.grid.cells, self.grid.size, self.passable, self.g
+        path = []
+        current = start
+        while current != self.root:
+            best, best_move = INF, None
+            for direction, step in self.grid.moves:
+                neighbor = current + step
+                if 0 <= neighbor < size and passable[cells[neighbor]]:
+                    cost = 0 if neighbor == self.root else g.get(neighbor, INF)
+                    if cost < best:
+                        best, best_move = cost, (direction, neighbor)
+            if best_move is None:
+                return None
+            path.append(best_move)
+            current = best_move[1]
+        return path
+
+
+# Planner keeping one D* Lite tree per root cell between queries. A query
+# reuses a tree rooted at either end; the human walking around then only
+# moves the free end of an existing tree instead of starting a new search.
+class IncrementalPlanner:
+    def __init__(self, grid, max_trees=64):
+        self.grid = grid
+        self.max_trees = max_trees
+        self.trees = OrderedDict()  # root -> DStarLite, least recently used first
+        self._doors = None
+        self.expanded = 0  # work done by the last query
+        self.pushes = 0
+        grid.listeners.append(self.cell_changed)
+
+    def cell_changed(self, idx):
+        self._doors = None
+        for tree in self.trees.values():
+            tree.cell_changed(idx)
+
+    def _tree(self, start, goal, mask):
+        if self._doors is None:
+            self._doors = self.grid.doors()
+        tree = self.trees.get(goal)
+        reverse = False
+        if tree is None:
+            tree = self.trees.get(start)
+            passable, cells = PASSABLE[mask], self.grid.cells
+            # A reversed tree also enters start, and never checks goal
+            if tree is not None and passable[cells[start]] and passable[cells[goal]]:
+                reverse = True
+            else:
+                tree = self.trees[goal] = DStarLite(self.grid, goal, mask, start)
+                if len(self.trees) > self.max_trees:
+                    self.trees.popitem(last=False)
+        self.trees.move_to_end(tree.root)
+        tree.set_mask(mask, self._doors)
+        return tree, reverse
+
+    def distance(self, start, goal, collected_keys):
+        tree, reverse = self._tree(start, goal, key_mask(collected_keys))
+        expanded, pushes = tree.expanded, tree.pushes
+        cost = tree.distance(goal if reverse else start)
+        self.expanded, self.pushes = tree.expanded - expanded, tree.pushes - pushes
+        return cost
+
+    # Same contract as find_path: the moves from start to goal, or [] if unreachable
+    def find_path(self, start, goal, collected_keys):
+        tree, reverse = self._tree(start, goal, key_mask(collected_keys))
+        expanded, pushes = tree.expanded, tree.pushes
+        path = tree.path_from(goal if reverse else start)
+        self.expanded, self.pushes = tree.expanded - expanded, tree.pushes - pushes
+        if not reverse:
+            return path or []
+        if not path:
+            return []
+        # Walk the goal-to-start moves backwards
+        cells = [goal] + [cell for _, cell in path[:-1]]
+        return [(OPPOSITE[direction], cell) for (direction, _), cell in zip(reversed(path), reversed(cells))]
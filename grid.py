@@ -0,0 +1,169 @@
+import mmap
+import os
+import re
+
+from keyindex import KeyIndex
+
+# Define movement directions and commands
+directions = {'UP': (-1, 0), 'DOWN': (1, 0), 'LEFT': (0, -1), 'RIGHT': (0, 1)}
+key_door_map = {'b': 'B', 'r': 'R', 'g': 'G', 'y': 'Y'}  # Maps keys to doors
+
+# Cell class codes; every byte not listed below (floor, 'm', 'h') is class 0
+WALL = 1
+DOOR = 2  # DOOR + color index, one code per door color
+KEY = 6   # KEY + color index, one code per key color
+
+# Every row is followed by this byte so that stepping off either side of a
+# row lands on a wall and the planners never need a column bounds check
+ROW_END = ord('\n')
+
+# Color index and key bit of every key/door letter
+KEY_COLORS = ''.join(key_door_map)
+KEY_BITS = {key: 1 << i for i, key in enumerate(KEY_COLORS)}
+ALL_KEYS = (1 << len(KEY_COLORS)) - 1
+
+DOOR_PATTERN = re.compile(b'[' + ''.join(key_door_map.values()).encode() + b']')
+KEY_PATTERN = re.compile(b'[' + KEY_COLORS.encode() + b']')
+
+# Map every byte to its cell class
+CELL_CLASS = bytearray(256)
+for _byte in b'W\r\n':
+    CELL_CLASS[_byte] = WALL
+for _i, _key in enumerate(KEY_COLORS):
+    CELL_CLASS[ord(key_door_map[_key])] = DOOR + _i
+    CELL_CLASS[ord(_key)] = KEY + _i
+
+# Passability table per key set: PASSABLE[mask][byte] is 1 if a cell holding
+# that byte can be entered while carrying the keys in mask
+PASSABLE = []
+for _mask in range(ALL_KEYS + 1):
+    _table = bytearray(256)
+    for _byte in range(256):
+        _cls = CELL_CLASS[_byte]
+        if _cls == WALL:
+            continue
+        if DOOR <= _cls < KEY and not _mask & (1 << (_cls - DOOR)):
+            continue
+        _table[_byte] = 1
+    PASSABLE.append(bytes(_table))
+
+# Bit i of PASSABILITY[byte] is set if that byte is passable under key mask i,
+# so two bytes with the same value are interchangeable for every planner
+PASSABILITY = [sum(PASSABLE[_mask][_byte] << _mask for _mask in range(ALL_KEYS + 1))
+               for _byte in range(256)]
+
+
+# Pack a set of key colors into a bitmask
+def key_mask(collected_keys):
+    mask = 0
+    for key in collected_keys:
+        mask |= KEY_BITS.get(key, 0)
+    return mask
+
+
+# Compact grid stored as one byte per cell in a flat buffer
+class Grid:
+    def __init__(self, cells, rows, cols, stride=None, size=None):
+        self.cells = cells
+        self.rows = rows
+        self.cols = cols
+        self.stride = stride if stride is not None else cols + 1
+        self.size = size if size is not None else len(cells)
+        # Called with the cell index whenever a cell's passability changes
+        self.listeners = []
+        # Index offsets of each direction, in the same order as directions
+        self.moves = [(name, dx * self.stride + dy) for name, (dx, dy) in directions.items()]
+
+    # Build a grid from a list of row strings
+    @classmethod
+    def from_rows(cls, rows):
+        cols = max((len(row) for row in rows), default=0)
+        stride = cols + 1
+        cells = bytearray(bytes([ROW_END]) * (stride * len(rows)))
+        for i, row in enumerate(rows):
+            cells[i * stride:i * stride + len(row)] = row.encode()
+        return cls(cells, len(rows), cols, stride)
+
+    def index(self, pos):
+        return pos[0] * self.stride + pos[1]
+
+    def pos(self, idx):
+        return divmod(idx, self.stride)
+
+    def cell(self, idx):
+        return chr(self.cells[idx])
+
+    # True if idx is on the grid and not a wall
+    def is_open(self, idx):
+        return 0 <= idx < self.size and CELL_CLASS[self.cells[idx]] != WALL
+
+    # Change one cell and notify the listeners if that changes where planners can go
+    def set_cell(self, idx, value):
+        old = self.cells[idx]
+        self.cells[idx] = value
+        if PASSABILITY[old] != PASSABILITY[value]:
+            for listener in self.listeners:
+                listener(idx)
+
+    # Passability table for the given collected keys
+    def passable(self, collected_keys):
+        return PASSABLE[key_mask(collected_keys)]
+
+    # Indices of every door cell in row-major order
+    def doors(self):
+        return [match.start() for match in DOOR_PATTERN.finditer(self.cells, 0, self.size)]
+
+    def __str__(self):
+        return '\n'.join(bytes(self.cells[i * self.stride:i * self.stride + self.cols]).decode()
+                         for i in range(self.rows))
+
+
+# Locate the agent, the human and the keys in a loaded grid
+def locate(grid):
+    cells, size = grid.cells, grid.size
+    agent_pos = cells.find(b'm', 0, size)
+    human_pos = cells.find(b'h', 0, size)
+    keys = KeyIndex(grid)
+    for match in KEY_PATTERN.finditer(cells, 0, size):
+        keys.add(chr(cells[match.start()]), match.start())  # store every key location
+    return grid, (agent_pos if agent_pos >= 0 else None), (human_pos if human_pos >= 0 else None), keys
+
+
+# Load grid from file
+def load_grid(filename):
+    with open(filename, 'r') as file:
+        grid = Grid.from_rows([line.strip() for line in file.readlines()])
+    return locate(grid)
+
+
+# Load grid by memory-mapping the file and using its bytes as the cells.
+# The line terminators act as the row-end walls, so no cell is copied; the
+# mapping is copy-on-write so moving the human never touches the file.
+def load_grid_mmap(filename):
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return locate(Grid(bytearray(), 0, 0))
+        cells = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    # Ignore blank lines and line terminators at the end of the file
+    size = len(cells)
+    while size > 0 and cells[size - 1] in b'\r\n':
+        size -= 1
+
+    newline = cells.find(b'\n', 0, size)
+    if newline < 0:
+        return locate(Grid(cells, 1, size, size + 1, size))
+    stride = newline + 1
+    cols = newline - 1 if newline > 0 and cells[newline - 1] == ord('\r') else newline
+    rows = (size + stride - cols) // stride
+
+    # Every row must have the same width and line terminator
+    for i in range(rows):
+        start = i * stride
+        if cells.find(b'\n', start, start + cols) >= 0 or cells.find(b'\r', start, start + cols) >= 0:
+            raise ValueError(f"{filename}: row {i} is shorter than {cols} cells")
+        if i < rows - 1 and cells[start + stride - 1] != ROW_END:
+            raise ValueError(f"{filename}: row {i} is longer than {cols} cells")
+    if size != (rows - 1) * stride + cols:
+        raise ValueError(f"{filename}: last row is not {cols} cells wide")
+    return locate(Grid(cells, rows, cols, stride, size))
@@ -0,0 +1,322 @@
+import heapq
+import sys
+
+from grid import CELL_CLASS, DOOR, DOOR_PATTERN, KEY, PASSABLE, WALL, load_grid, key_mask
+from planner import PathPlanner
+
+# Side length, in cells, of one cluster
+CLUSTER_SIZE = 16
+# Border runs at least this long get a transition at both ends instead of one in the middle
+LONG_RUN = 6
+
+# Cells a search may walk through inside a cluster: doors are never crossed
+# there, they are abstract nodes of their own
+FLOOR_ONLY = PASSABLE[0]
+
+
+def _is_door(byte):
+    return DOOR <= CELL_CLASS[byte] < KEY
+
+
+# Hierarchical A* (HPA*). The grid is cut into square clusters; the abstract
+# graph has a node for every transition cell on a cluster border and for
+# every door, with edges for the shortest walk between two nodes of the same
+# cluster and for every step across a border. Doors stay closed in the walks
+# inside a cluster, so an edge that touches a door is only usable with the
+# matching key. Clusters are built on first use and rebuilt when one of
+# their cells changes. Paths are close to, but not always, the shortest.
+class HierarchicalPlanner:
+    def __init__(self, grid, cluster_size=CLUSTER_SIZE):
+        self.grid = grid
+        self.size = cluster_size
+        self.cluster_rows = -(-grid.rows // cluster_size)
+        self.cluster_cols = -(-grid.cols // cluster_size)
+        self.borders = {}   # ('right' | 'down', cluster) -> [(cell, cell across the border), ...]
+        self.crossings = {}  # cell -> cells across a border it is connected to
+        self.edges = {}     # cluster -> {node: [(node, cost), ...]}
+        self.expanded = 0
+        self.pushes = 0
+        self.max_open = 0
+        self.names = {step: name for name, step in grid.moves}
+        grid.listeners.append(self.cell_changed)
+
+    def cluster_of(self, idx):
+        row, col = divmod(idx, self.grid.stride)
+        return (row // self.size) * self.cluster_cols + col // self.size
+
+    # (first row, end row, first col, end col) of a cluster
+    def _bounds(self, cluster):
+        grid, size = self.grid, self.size
+        row, col = divmod(cluster, self.cluster_cols) if self.cluster_cols else (0, 0)
+        return (row * size, min(grid.rows, (row + 1) * size),
+                col * size, min(grid.cols, (col + 1) * size))
+
+    # Clusters on the other side of each border of a cluster, with the border's key
+    def _borders_of(self, cluster):
+        row, col = divmod(cluster, self.cluster_cols)
+        if col + 1 < self.cluster_cols:
+            yield ('right', cluster), cluster + 1
+        if col > 0:
+            yield ('right', cluster - 1), cluster - 1
+        if row + 1 < self.cluster_rows:
+            yield ('down', cluster), cluster + self.cluster_cols
+        if row > 0:
+            yield ('down', cluster - self.cluster_cols), cluster - self.cluster_cols
+
+    # Transition cell pairs across one border: one pair per run of open
+    # cells on both sides (two for long runs) plus every pair with a door
+    def _border(self, key):
+        pairs = self.borders.get(key)
+        if pairs is not None:
+            return pairs
+        side, cluster = key
+        cells, stride = self.grid.cells, self.grid.stride
+        first_row, end_row, first_col, end_col = self._bounds(cluster)
+        if side == 'right':
+            step, across = stride, 1
+            start = first_row * stride + end_col - 1
+            count = end_row - first_row
+        else:
+            step, across = 1, stride
+            start = (end_row - 1) * stride + first_col
+            count = end_col - first_col
+
+        pairs = []
+        run = []
+
+        def close_run():
+            if len(run) >= LONG_RUN:
+                pairs.extend((run[0], run[-1]))
+            elif run:
+                pairs.append(run[len(run) // 2])
+            run.clear()
+
+        for i in range(count):
+            a = start + i * step
+            b = a + across
+            if CELL_CLASS[cells[a]] == WALL or CELL_CLASS[cells[b]] == WALL:
+                close_run()
+            elif _is_door(cells[a]) or _is_door(cells[b]):
+                close_run()
+                pairs.append((a, b))
+            else:
+                run.append((a, b))
+        close_run()
+
+        self.borders[key] = pairs
+        for a, b in pairs:
+            self.crossings.setdefault(a, []).append(b)
+            self.crossings.setdefault(b, []).append(a)
+        return pairs
+
+    def _drop_border(self, key):
+        for a, b in self.borders.pop(key, ()):
+            for cell, other in ((a, b), (b, a)):
+                partners = self.crossings.get(cell)
+                if partners is not None:
+                    partners.remove(other)
+                    if not partners:
+                        del self.crossings[cell]
+
+    # Breadth-first walk inside one cluster without crossing doors. Returns
+    # the distance of every reached cell and, if asked, its parent.
+    def _walk(self, cluster, source, goal=None, parents=None):
+        cells, stride = self.grid.cells, self.grid.stride
+        first_row, end_row, first_col, end_col = self._bounds(cluster)
+        steps = [step for _, step in self.grid.moves]
+        dist = {source: 0}
+        frontier = [source]
+        distance = 0
+        while frontier and goal not in dist:
+            distance += 1
+            next_frontier = []
+            for current in frontier:
+                for step in steps:
+                    neighbor = current + step
+                    if neighbor in dist:
+                        continue
+                    row, col = divmod(neighbor, stride)
+                    if not (first_row <= row < end_row and first_col <= col < end_col):
+                        continue
+                    byte = cells[neighbor]
+                    if FLOOR_ONLY[byte]:
+                        next_frontier.append(neighbor)
+                    elif not _is_door(byte):
+                        continue
+                    # Doors are reached but never walked through
+                    dist[neighbor] = distance
+                    if parents is not None:
+                        parents[neighbor] = current
+            frontier = next_frontier
+            self.expanded += len(frontier)
+        return dist
+
+    # Abstract nodes of a cluster: its transition cells and its doors
+    def _nodes(self, cluster):
+        first_row, end_row, first_col, end_col = self._bounds(cluster)
+        nodes = set()
+        for key, _ in self._borders_of(cluster):
+            for pair in self._border(key):
+                nodes.update(cell for cell in pair if self.cluster_of(cell) == cluster)
+        cells, stride = self.grid.cells, self.grid.stride
+        for row in range(first_row, end_row):
+            nodes.update(match.start() for match in
+                         DOOR_PATTERN.finditer(cells, row * stride + first_col, row * stride + end_col))
+        return nodes
+
+    # Edges between the nodes of a cluster, built on first use
+    def _cluster_edges(self, cluster):
+        edges = self.edges.get(cluster)
+        if edges is None:
+            nodes = self._nodes(cluster)
+            edges = {}
+            for node in nodes:
+                dist = self._walk(cluster, node)
+                edges[node] = [(other, dist[other]) for other in nodes if other != node and other in dist]
+            self.edges[cluster] = edges
+        return edges
+
+    # Build the whole abstract graph up front
+    def precompute(self):
+        for cluster in range(self.cluster_rows * self.cluster_cols):
+            self._cluster_edges(cluster)
+
+    # Abstract A* from start to goal. Returns (cost, node path) or None.
+    def search(self, start, goal, collected_keys):
+        grid = self.grid
+        stride = grid.stride
+        passable = PASSABLE[key_mask(collected_keys)]
+        self.expanded = self.pushes = self.max_open = 0
+        if start == goal:
+            return 0, [start]
+        if not passable[grid.cells[goal]]:
+            return None
+
+        # Connect start and goal to the nodes of their clusters
+        start_cluster, goal_cluster = self.cluster_of(start), self.cluster_of(goal)
+        start_edges = self._walk(start_cluster, start)
+        goal_dist = self._walk(goal_cluster, goal)
+        goal_edges = {}
+        for node in self._cluster_edges(goal_cluster):
+            if node in goal_dist:
+                goal_edges[node] = goal_dist[node]
+        goal_row, goal_col = divmod(goal, stride)
+
+        def neighbors(node):
+            if node == start:
+                nodes = self._cluster_edges(start_cluster)
+                yield from ((other, start_edges[other]) for other in nodes if other in start_edges)
+                if goal in start_edges:
+                    yield goal, start_edges[goal]
+                if start not in nodes:
+                    return
+            yield from self._cluster_edges(self.cluster_of(node)).get(node, ())
+            for other in self.crossings.get(node, ()):
+                yield other, 1
+            if node in goal_edges:
+                yield goal, goal_edges[node]
+
+        row, col = divmod(start, stride)
+        costs = {start: 0}
+        parents = {start: None}
+        heap = [(abs(row - goal_row) + abs(col - goal_col), start, 0)]
+        expanded = pushes = max_open = 0
+        found = None
+        while heap:
+            _, current, cost = heapq.heappop(heap)
+            if current == goal:
+                found = cost
+                break
+            if cost > costs[current]:
+                continue
+            expanded += 1
+            for other, step_cost in neighbors(current):
+                if not passable[grid.cells[other]]:
+                    continue  # A door without its key
+                new_cost = cost + step_cost
+                if other not in costs or new_cost < costs[other]:
+                    costs[other] = new_cost
+                    parents[other] = current
+                    row, col = divmod(other, stride)
+                    heapq.heappush(heap, (new_cost + abs(row - goal_row) + abs(col - goal_col), other, new_cost))
+                    pushes += 1
+            if len(heap) > max_open:
+                max_open = len(heap)
+        self.expanded += expanded
+        self.pushes, self.max_open = pushes, max_open
+        if found is None:
+            return None
+        nodes = []
+        current = goal
+        while current is not None:
+            nodes.append(current)
+            current = parents[current]
+        nodes.reverse()
+        return found, nodes
+
+    def distance(self, start, goal, collected_keys):
+        result = self.search(start, goal, collected_keys)
+        return result[0] if result else None
+
+    # Same contract as find_path: the moves from start to goal, or [] if
+    # unreachable. Only the segments on the abstract path are walked again.
+    def find_path(self, start, goal, collected_keys):
+        result = self.search(start, goal, collected_keys)
+        if result is None:
+            return []
+        _, nodes = result
+        names = self.names
+        path = []
+        for a, b in zip(nodes, nodes[1:]):
+            cluster = self.cluster_of(a)
+            if self.cluster_of(b) != cluster:
+                path.append((names[b - a], b))
+                continue
+            parents = {}
+            self._walk(cluster, a, b, parents)
+            segment = []
+            current = b
+            while current != a:
+                parent = parents[current]
+                segment.append((names[current - parent], current))
+                current = parent
+            segment.reverse()
+            path.extend(segment)
+        return path
+
+    # A changed cell only affects its own cluster and the borders it lies on
+    def cell_changed(self, idx):
+        cluster = self.cluster_of(idx)
+        for key, neighbor in list(self._borders_of(cluster)):
+            self._drop_border(key)
+            self.edges.pop(neighbor, None)
+        self.edges.pop(cluster, None)
+
+
+# Compare HPA* path lengths with A* between every pair of cells. Returns
+# the (start, goal, A* length, HPA* length) of every pair that differs.
+def cross_check(grid, cells, collected_keys=(), cluster_size=CLUSTER_SIZE):
+    astar = PathPlanner(grid)
+    hpa = HierarchicalPlanner(grid, cluster_size)
+    differences = []
+    for start in cells:
+        for goal in cells:
+            expected = astar.search(start, goal, collected_keys)
+            path = hpa.find_path(start, goal, collected_keys)
+            actual = len(path) if path or start == goal else None
+            if expected != actual:
+                differences.append((start, goal, expected, actual))
+    return differences
+
+
+# Cross-check HPA* against A* between the agent, the human and every key
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python hpa.py <grid_file> [<grid_file> ...]")
+    for grid_file in sys.argv[1:]:
+        grid, agent_pos, human_pos, keys = load_grid(grid_file)
+        cells = [pos for pos in [agent_pos, human_pos] + keys.instances() if pos is not None]
+        differences = cross_check(grid, cells, cluster_size=4)
+        for start, goal, expected, actual in differences:
+            print(f"{grid_file}: {grid.pos(start)} -> {grid.pos(goal)}: A* {expected}, HPA* {actual}")
+        print(f"{grid_file}: {len(cells) ** 2 - len(differences)}/{len(cells) ** 2} paths as short as A*")
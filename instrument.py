@@ -0,0 +1,128 @@
+import json
+import marshal
+import time
+from contextlib import contextmanager
+
+# Recorder collecting counters, timers and trace events, or None when
+# instrumentation is off. Hot paths test it once and skip all bookkeeping.
+_recorder = None
+
+
+class Recorder:
+    def __init__(self, max_events=100000):
+        self.start = time.perf_counter()
+        self.counters = {}
+        self.timers = {}  # name -> [calls, total seconds, max seconds]
+        self.events = []
+        self.max_events = max_events
+        self.dropped_events = 0
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def peak(self, name, value):
+        if value > self.counters.get(name, 0):
+            self.counters[name] = value
+
+    def add_time(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def event(self, kind, **fields):
+        if len(self.events) >= self.max_events:
+            self.dropped_events += 1
+            return
+        fields['kind'] = kind
+        fields['t'] = time.perf_counter() - self.start
+        self.events.append(fields)
+
+    def summary(self):
+        return {
+            'counters': dict(self.counters),
+            'timers': {name: {'calls': calls, 'seconds': total, 'max_seconds': longest}
+                       for name, (calls, total, longest) in self.timers.items()},
+            'events': self.events,
+            'dropped_events': self.dropped_events,
+        }
+
+    def write_json(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    # Write the timers in the marshalled format of cProfile/pstats, so the
+    # usual tools (pstats.Stats, snakeviz, ...) can load them
+    def write_pstats(self, filename):
+        stats = {}
+        for name, (calls, total, _) in self.timers.items():
+            stats[('simulate', 0, name)] = (calls, calls, total, total, {})
+        with open(filename, 'wb') as file:
+            marshal.dump(stats, file)
+
+
+def enable(max_events=100000):
+    global _recorder
+    _recorder = Recorder(max_events)
+    return _recorder
+
+
+def disable():
+    global _recorder
+    _recorder = None
+
+
+def recorder():
+    return _recorder
+
+
+# Time a block under name when instrumentation is on
+@contextmanager
+def timed(name):
+    if _recorder is None:
+        yield
+    else:
+        with _recorder.timer(name):
+            yield
+
+
+# Wraps a planner to time its queries and collect its search counters
+class InstrumentedPlanner:
+    def __init__(self, planner, recorder):
+        self.planner = planner
+        self.recorder = recorder
+        self.name = type(planner).__name__
+
+    def _record(self, query, seconds):
+        planner, recorder = self.planner, self.recorder
+        recorder.add_time(f"{self.name}.{query}", seconds)
+        recorder.count('nodes_expanded', planner.expanded)
+        recorder.count('heap_pushes', planner.pushes)
+        recorder.peak('max_open_list', getattr(planner, 'max_open', 0))
+
+    def distance(self, start, goal, collected_keys):
+        started = time.perf_counter()
+        cost = self.planner.distance(start, goal, collected_keys)
+        self._record('distance', time.perf_counter() - started)
+        return cost
+
+    def find_path(self, start, goal, collected_keys):
+        started = time.perf_counter()
+        path = self.planner.find_path(start, goal, collected_keys)
+        self._record('find_path', time.perf_counter() - started)
+        return path
+
+    def __getattr__(self, name):
+        return getattr(self.planner, name)
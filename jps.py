@@ -0,0 +1,270 @@
+import heapq
+import sys
+from array import array
+from collections import OrderedDict
+
+from grid import PASSABLE, key_mask, load_grid
+from planner import PathPlanner
+
+
+# Jump Point Search for 4-connected grids. Straight runs of open cells are
+# skipped without touching the heap: a horizontal jump stops where a cell
+# above or below opens up, and a vertical jump stops wherever a horizontal
+# jump from it would find a jump point. Paths have the same length as A*.
+#
+# Where a jump ends does not depend on the goal, except that the goal ends
+# it early, so the jump from every cell is kept between searches (as in
+# JPS+) and the goal is checked against it. The jumps are filled in as the
+# searches walk the grid, for the most recently used key sets, one row or
+# column at a time so that parts of the grid no search reached cost nothing.
+class JumpPointPlanner:
+    def __init__(self, grid, max_masks=4):
+        self.grid = grid
+        self.max_masks = max_masks
+        self.jumps = OrderedDict()  # key mask -> (open cells, {step: jumps per row or column})
+        # Jumps are stored as distances, which fit in two bytes unless the grid is huge
+        self.typecode = 'h' if max(grid.stride, grid.size // grid.stride) < 32767 else 'i'
+        self.expanded = 0
+        self.pushes = 0
+        self.max_open = 0
+        self._parents = {}
+        grid.listeners.append(self.cell_changed)
+
+    # A cell changed: for the key sets it opened or closed, fix its byte and
+    # forget the horizontal jumps in its row and the rows beside it, which
+    # look at it. Vertical jumps in any column may probe those rows, so they
+    # are all forgotten.
+    def cell_changed(self, idx):
+        grid = self.grid
+        stride = grid.stride
+        row = idx // stride
+        for mask, (opened, jumps) in self.jumps.items():
+            passable = PASSABLE[mask][grid.cells[idx]]
+            if opened[idx + stride] == passable:
+                continue
+            opened[idx + stride] = passable
+            for step in (-1, 1):
+                lines = jumps[step]
+                for line in range(max(row - 1, 0), min(row + 2, len(lines))):
+                    lines[line] = None
+            for step in (-stride, stride):
+                jumps[step][:] = [None] * stride
+
+    # Cells that can be entered with one key set, as one byte per cell with
+    # a row of walls on either side so that no lookup needs a bounds check:
+    # cell idx is at idx + stride. Then the jumps for the key set, per step
+    # and per row (horizontal steps) or column (vertical steps): for every
+    # cell, the number of steps to the jump point ahead when there is one,
+    # else -1 - the number of steps to the last open cell before the wall,
+    # or 0 if no search has walked there yet.
+    def _jumps(self, mask):
+        entry = self.jumps.get(mask)
+        if entry is None:
+            grid = self.grid
+            size, stride = grid.size, grid.stride
+            padding = bytes(stride)
+            opened = bytearray(padding + bytes(grid.cells[:size]).translate(PASSABLE[mask]) + padding)
+            rows = size // stride
+            entry = self.jumps[mask] = (opened, {-1: [None] * rows, 1: [None] * rows,
+                                                 -stride: [None] * stride, stride: [None] * stride})
+            if len(self.jumps) > self.max_masks:
+                self.jumps.popitem(last=False)
+        self.jumps.move_to_end(mask)
+        return entry
+
+    # Search from start to goal; return the path cost or None if unreachable
+    def search(self, start, goal, collected_keys):
+        grid = self.grid
+        size, stride = grid.size, grid.stride
+        opened, jumps = self._jumps(key_mask(collected_keys))
+        typecode = self.typecode
+        itemsize = array(typecode).itemsize
+        row_zeros = array(typecode, bytes(stride * itemsize))
+        column_zeros = array(typecode, bytes(size // stride * itemsize))
+        below = 2 * stride
+        goal_row, goal_col = divmod(goal, stride)
+
+        # Store the jump found from the last walked cell, at index last in
+        # known, for all the walked cells: every cell walked past has the same
+        # jump as the first one, a step further away for each cell back
+        def record(known, first, last, idx, point, step):
+            if point >= 0:
+                steps, further = (point - idx) // step, 1
+            else:
+                steps, further = -1 - (-1 - point - idx) // step, -1
+            back = 1 if first > last else -1
+            known[last] = steps
+            while last != first:
+                last += back
+                steps += further
+                known[last] = steps
+
+        # Goal-free jump from idx, walking and recording it on first use: the
+        # jump point ahead, or -1 - the last open cell before the wall
+        def horizontal_point(idx, step):
+            row, at = divmod(idx, stride)
+            lines = jumps[step]
+            known = lines[row]
+            if known is None:
+                known = lines[row] = array(typecode, row_zeros)
+            steps = known[at]
+            if steps:
+                return idx + steps * step if steps > 0 else -1 - idx + (steps + 1) * step
+            first = at
+            while True:
+                ahead = idx + step
+                if not opened[ahead + stride]:
+                    point = -1 - idx
+                    break
+                if (opened[ahead] and not opened[idx]) or (opened[ahead + below] and not opened[idx + below]):
+                    point = ahead
+                    break
+                steps = known[at + step]
+                if steps:
+                    point = ahead + steps * step if steps > 0 else -1 - ahead + (steps + 1) * step
+                    break
+                at += step
+                idx = ahead
+            record(known, first, at, idx, point, step)
+            return point
+
+        def vertical_point(idx, step):
+            at, column = divmod(idx, stride)
+            lines = jumps[step]
+            known = lines[column]
+            if known is None:
+                known = lines[column] = array(typecode, column_zeros)
+            steps = known[at]
+            if steps:
+                return idx + steps * step if steps > 0 else -1 - idx + (steps + 1) * step
+            line_step = 1 if step > 0 else -1
+            first = at
+            while True:
+                ahead = idx + step
+                if not opened[ahead + stride]:
+                    point = -1 - idx
+                    break
+                if (opened[ahead + stride - 1] and not opened[idx + stride - 1]) or \
+                        (opened[ahead + stride + 1] and not opened[idx + stride + 1]) or \
+                        horizontal_point(ahead, -1) >= 0 or horizontal_point(ahead, 1) >= 0:
+                    point = ahead
+                    break
+                steps = known[at + line_step]
+                if steps:
+                    point = ahead + steps * step if steps > 0 else -1 - ahead + (steps + 1) * step
+                    break
+                at += line_step
+                idx = ahead
+            record(known, first, at, idx, point, step)
+            return point
+
+        # Walk horizontally from idx; return the first jump point or None
+        def jump_horizontal(idx, step):
+            point = horizontal_point(idx, step)
+            stop = point if point >= 0 else -1 - point
+            if 0 < (goal - idx) * step <= (stop - idx) * step:
+                return goal
+            return point if point >= 0 else None
+
+        # Walk vertically from idx; return the first jump point or None. The
+        # jump also ends in the goal's row if the goal can be reached along it.
+        def jump_vertical(idx, step):
+            point = vertical_point(idx, step)
+            stop = point if point >= 0 else -1 - point
+            cross = goal_row * stride + idx % stride
+            if 0 < (cross - idx) * step <= (stop - idx) * step and \
+                    (cross == goal or jump_horizontal(cross, 1 if goal > cross else -1) == goal):
+                return cross
+            return point if point >= 0 else None
+
+        # Directions worth following from a jump point reached by a given step
+        horizontal, vertical = (-1, 1), (-stride, stride)
+        successors = {0: vertical + horizontal, 1: vertical + (1,), -1: vertical + (-1,),
+                      stride: horizontal + (stride,), -stride: horizontal + (-stride,)}
+
+        row, col = divmod(start, stride)
+        costs = {start: 0}
+        parents = {start: (None, 0)}
+        heap = [(abs(row - goal_row) + abs(col - goal_col), start, 0)]
+        expanded = pushes = max_open = 0
+        found = None
+        while heap:
+            _, current, cost = heapq.heappop(heap)
+            if current == goal:
+                found = cost
+                break
+            if cost > costs[current]:
+                continue
+            expanded += 1
+            for step in successors[parents[current][1]]:
+                if abs(step) == 1:
+                    point = jump_horizontal(current, step)
+                else:
+                    point = jump_vertical(current, step)
+                if point is None:
+                    continue
+                new_cost = cost + abs(point - current) // abs(step)
+                if point not in costs or new_cost < costs[point]:
+                    costs[point] = new_cost
+                    parents[point] = (current, step)
+                    row, col = divmod(point, stride)
+                    heapq.heappush(heap, (new_cost + abs(row - goal_row) + abs(col - goal_col),
+                                          point, new_cost))
+                    pushes += 1
+            if len(heap) > max_open:
+                max_open = len(heap)
+        self.expanded, self.pushes, self.max_open = expanded, pushes, max_open
+        self._parents = parents
+        return found
+
+    def distance(self, start, goal, collected_keys):
+        return self.search(start, goal, collected_keys)
+
+    # Same contract as find_path: the moves from start to goal, or [] if unreachable
+    def find_path(self, start, goal, collected_keys):
+        if self.search(start, goal, collected_keys) is None:
+            return []
+        names = {step: name for name, step in self.grid.moves}
+        path = []
+        current = goal
+        while current != start:
+            parent, step = self._parents[current]
+            # Expand the straight segment between two jump points into single moves
+            segment = []
+            cell = current
+            while cell != parent:
+                segment.append((names[step], cell))
+                cell -= step
+            path.extend(segment)
+            current = parent
+        path.reverse()
+        return path
+
+
+# Compare JPS path lengths with A* for every pair of start and goal cells.
+# Returns the (start, goal, A* length, JPS length) of every mismatch.
+def cross_check(grid, cells, collected_keys=()):
+    astar = PathPlanner(grid)
+    jps = JumpPointPlanner(grid)
+    mismatches = []
+    for start in cells:
+        for goal in cells:
+            expected = astar.search(start, goal, collected_keys)
+            path = jps.find_path(start, goal, collected_keys)
+            actual = len(path) if path or start == goal else None
+            if expected != actual:
+                mismatches.append((start, goal, expected, actual))
+    return mismatches
+
+
+# Cross-check JPS against A* between the agent, the human and every key
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python jps.py <grid_file> [<grid_file> ...]")
+    for grid_file in sys.argv[1:]:
+        grid, agent_pos, human_pos, keys = load_grid(grid_file)
+        cells = [pos for pos in [agent_pos, human_pos] + keys.instances() if pos is not None]
+        mismatches = cross_check(grid, cells)
+        for start, goal, expected, actual in mismatches:
+            print(f"{grid_file}: {grid.pos(start)} -> {grid.pos(goal)}: A* {expected}, JPS {actual}")
+        print(f"{grid_file}: {len(cells) ** 2 - len(mismatches)}/{len(cells) ** 2} paths match")
@@ -0,0 +1,127 @@
+import heapq
+
+from components import components_for
+from grid import KEY_BITS, KEY_COLORS, PASSABLE, key_mask
+
+
+# Planner over (cell, key mask) states: stepping onto a key instance picks
+# it up and from then on its doors can be passed, so a route may fetch the
+# keys of the doors in its way first. The grid's connected components per
+# key mask reject goals no set of reachable keys can open a way to, and
+# prune states that can no longer reach the goal.
+class KeyedPlanner:
+    def __init__(self, grid, keys):
+        self.grid = grid
+        self.keys = keys  # KeyIndex of the instances still on the grid
+        self.components = components_for(grid)
+        self.expanded = 0
+        self.pushes = 0
+        self.max_open = 0
+
+    # Component of idx under mask; cells that cannot be entered are their own
+    def component(self, idx, mask):
+        return self.components.label(idx, mask)
+
+    # Largest key mask reachable from idx starting with mask: keep adding the
+    # colors of the key instances in the current component until none is new
+    def closure(self, idx, mask, key_cells):
+        while True:
+            label = self.component(idx, mask)
+            gained = mask
+            for cell, bit in key_cells.items():
+                if not gained & bit and self.component(cell, mask) == label:
+                    gained |= bit
+            if gained == mask:
+                return mask
+            mask = gained
+
+    # Search from start to goal. Returns (moves, pickups) where pickups lists
+    # (index into moves, key, cell) for every key picked up on the way, or
+    # None if no order of fetching keys reaches the goal.
+    def plan(self, start, goal, collected_keys):
+        grid = self.grid
+        cells, size, stride = grid.cells, grid.size, grid.stride
+        key_cells = {}
+        for key in KEY_COLORS:
+            for cell in self.keys.positions(key):
+                key_cells[cell] = KEY_BITS[key]
+        mask = key_mask(collected_keys)
+        self.expanded = self.pushes = self.max_open = 0
+
+        # Memoized per query: whether the goal is reachable from a (component, mask) state
+        reachable = {}
+
+        def can_reach(idx, mask):
+            state = (self.component(idx, mask), mask)
+            result = reachable.get(state)
+            if result is None:
+                final = self.closure(idx, mask, key_cells)
+                result = reachable[state] = self.component(goal, final) == self.component(idx, final)
+            return result
+
+        # A start the agent could not have walked onto has no component to check
+        if PASSABLE[mask][cells[start]] and not can_reach(start, mask):
+            return None
+
+        goal_row, goal_col = divmod(goal, stride)
+        steps = [(step, name) for name, step in grid.moves]
+        row, col = divmod(start, stride)
+        first = (start, mask)
+        costs = {first: 0}
+        parents = {first: None}
+        heap = [(abs(row - goal_row) + abs(col - goal_col), start, mask, 0)]
+        expanded = pushes = max_open = 0
+        found = None
+        while heap:
+            _, current, mask, cost = heapq.heappop(heap)
+            if current == goal:
+                found = (current, mask)
+                break
+            if cost > costs[(current, mask)]:
+                continue
+            expanded += 1
+            passable = PASSABLE[mask]
+            for step, _ in steps:
+                neighbor = current + step
+                if not (0 <= neighbor < size and passable[cells[neighbor]]):
+                    continue
+                new_mask = mask | key_cells.get(neighbor, 0)
+                if new_mask != mask and not can_reach(neighbor, new_mask):
+                    continue
+                state = (neighbor, new_mask)
+                if state not in costs or cost + 1 < costs[state]:
+                    costs[state] = cost + 1
+                    parents[state] = (current, mask)
+                    row, col = divmod(neighbor, stride)
+                    heapq.heappush(heap, (cost + 1 + abs(row - goal_row) + abs(col - goal_col),
+                                          neighbor, new_mask, cost + 1))
+                    pushes += 1
+            if len(heap) > max_open:
+                max_open = len(heap)
+        self.expanded, self.pushes, self.max_open = expanded, pushes, max_open
+        if found is None:
+            return None
+
+        names = {step: name for step, name in steps}
+        states = []
+        state = found
+        while state is not None:
+            states.append(state)
+            state = parents[state]
+        states.reverse()
+        moves, pickups = [], []
+        for (cell, mask), (next_cell, next_mask) in zip(states, states[1:]):
+            moves.append((names[next_cell - cell], next_cell))
+            if next_mask != mask:
+                pickups.append((len(moves) - 1, chr(cells[next_cell]), next_cell))
+        return moves, pickups
+
+    def distance(self, start, goal, collected_keys):
+        result = self.plan(start, goal, collected_keys)
+        return len(result[0]) if result else None
+
+    # Same contract as find_path: the moves from start to goal, or [] if unreachable
+    def find_path(self, start, goal, collected_keys):
+        result = self.plan(start, goal, collected_keys)
+        return result[0] if result else []
+
@@ -0,0 +1,95 @@
+import heapq
+
+# Side length, in cells, of one spatial bucket
+BUCKET_SIZE = 32
+
+
+# Spatial index of every key instance on the grid, bucketed per color
+class KeyIndex:
+    def __init__(self, grid, bucket_size=BUCKET_SIZE):
+        self.stride = grid.stride
+        self.bucket_size = bucket_size
+        self.max_ring = max(grid.rows, grid.cols) // bucket_size + 1
+        self.buckets = {}  # color -> {(bucket row, bucket col): [cell index, ...]}
+        self.counts = {}   # color -> number of instances left
+
+    def _bucket(self, idx):
+        row, col = divmod(idx, self.stride)
+        return row // self.bucket_size, col // self.bucket_size
+
+    def add(self, key, idx):
+        self.buckets.setdefault(key, {}).setdefault(self._bucket(idx), []).append(idx)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    # Remove one instance, e.g. once it has been picked up
+    def remove(self, key, idx):
+        buckets = self.buckets.get(key)
+        if not buckets:
+            return False
+        bucket = self._bucket(idx)
+        cells = buckets.get(bucket)
+        if not cells or idx not in cells:
+            return False
+        cells.remove(idx)
+        if not cells:
+            del buckets[bucket]
+        self.counts[key] -= 1
+        if not self.counts[key]:
+            del self.buckets[key]
+            del self.counts[key]
+        return True
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def positions(self, key):
+        return sorted(idx for cells in self.buckets.get(key, {}).values() for idx in cells)
+
+    # Every instance of every color
+    def instances(self):
+        return sorted(idx for buckets in self.buckets.values()
+                      for cells in buckets.values() for idx in cells)
+
+    # Key instances of one color in the ring of buckets at Chebyshev distance ring
+    def _ring(self, buckets, center, ring):
+        br, bc = center
+        if ring == 0:
+            yield from buckets.get(center, ())
+            return
+        for dc in range(-ring, ring + 1):
+            yield from buckets.get((br - ring, bc + dc), ())
+            yield from buckets.get((br + ring, bc + dc), ())
+        for dr in range(-ring + 1, ring):
+            yield from buckets.get((br + dr, bc - ring), ())
+            yield from buckets.get((br + dr, bc + ring), ())
+
+    # Find the instance of key with the lowest cost from pos. cost(idx) returns
+    # the real cost of using that instance, or None if it cannot be reached,
+    # and must never be lower than the Manhattan distance from pos. Without a
+    # cost function the Manhattan-nearest instance is returned.
+    def nearest(self, key, pos, cost=None):
+        buckets = self.buckets.get(key)
+        if not buckets:
+            return None
+        stride, size = self.stride, self.bucket_size
+        row, col = divmod(pos, stride)
+        center = self._bucket(pos)
+        candidates = []
+        best, best_cost = None, float('inf')
+
+        for ring in range(self.max_ring + 1):
+            for idx in self._ring(buckets, center, ring):
+                r, c = divmod(idx, stride)
+                heapq.heappush(candidates, (abs(r - row) + abs(c - col), idx))
+            # Instances in buckets not visited yet are at least this far away
+            bound = ring * size + 1 if ring < self.max_ring else float('inf')
+            while candidates and candidates[0][0] < bound:
+                distance, idx = heapq.heappop(candidates)
+                if distance >= best_cost:
+                    return best
+                total = cost(idx) if cost else distance
+                if total is not None and total < best_cost:
+                    best, best_cost = idx, total
+            if best_cost <= bound:
+                return best
+        return best
@@ -0,0 +1,130 @@
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import instrument
+from actions import stream_actions
+from distances import DistanceCache
+from grid import load_grid
+from P2_testing import PLANNERS, simulation
+from sinks import SINKS
+
+DEFAULT_HOST = '127.0.0.1'
+
+
+# Split tcp:[HOST:]PORT into (host, port)
+def parse_address(source):
+    host, _, port = source[len('tcp:'):].rpartition(':')
+    return host or DEFAULT_HOST, int(port)
+
+
+# Lines of human actions from '-' (stdin), tcp:[HOST:]PORT (the first client
+# to connect) or a path such as a named pipe
+@contextmanager
+def open_source(source):
+    if source == '-':
+        yield sys.stdin.buffer
+    elif source.startswith('tcp:'):
+        with socket.create_server(parse_address(source)) as server:
+            connection, _ = server.accept()
+            with connection, connection.makefile('rb') as lines:
+                yield lines
+    else:
+        with open(source, 'rb') as lines:
+            yield lines
+
+
+# Stand-in for a live human: send the lines of an action script to target
+# ('-', tcp:[HOST:]PORT or a path), one every delay seconds
+def produce(actions_file, target='-', delay=0.0, connect_timeout=5.0):
+    with open(actions_file, 'rb') as file:
+        lines = [line.rstrip(b'\r\n') + b'\n' for line in file]
+    if target == '-':
+        out, connection = sys.stdout.buffer, None
+    elif target.startswith('tcp:'):
+        # The simulation may not be listening yet
+        deadline = time.monotonic() + connect_timeout
+        while True:
+            try:
+                connection = socket.create_connection(parse_address(target))
+                break
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        out = connection.makefile('wb')
+    else:
+        out, connection = open(target, 'wb'), None
+    try:
+        for line in lines:
+            out.write(line)
+            out.flush()
+            if delay:
+                time.sleep(delay)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        if connection is not None:
+            connection.close()
+
+
+# Run the simulation online: every action is simulated as soon as its line
+# arrives and the agent's response is flushed before the next one is read
+def run_online(grid_file, source='-', output='-', planner='astar', sink='text'):
+    grid, agent_pos, human_pos, keys = load_grid(grid_file)
+    planner = PLANNERS[planner](grid)
+    if isinstance(planner, DistanceCache):
+        planner.sources.update([agent_pos] + keys.instances() + grid.doors())
+    if output == '-':
+        output = sys.stdout.buffer if sink == 'binary' else sys.stdout
+
+    with SINKS[sink](output, grid.stride) as sink, open_source(source) as lines:
+        steps = simulation(grid, agent_pos, human_pos, keys, sink, planner)
+        next(steps)
+        sink.flush()
+        for instruction in stream_actions(lines, source):
+            steps.send(instruction)
+            sink.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python online.py",
+                                     description="Simulate the agent on human actions as they arrive")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="simulate actions read from stdin, a named pipe or a TCP socket")
+    run.add_argument("grid_file")
+    run.add_argument("--source", default='-',
+                     help="'-' for stdin (default), tcp:[HOST:]PORT to listen for one client, or a path")
+    run.add_argument("--output", default='-', help="result file (default: stdout)")
+    run.add_argument("--planner", choices=sorted(PLANNERS), default='astar')
+    run.add_argument("--sink", choices=sorted(SINKS), default='text')
+    run.add_argument("--producer", metavar="ACTIONS_FILE",
+                     help="also start a stand-in producer sending this script to the source")
+    run.add_argument("--delay", type=float, default=0.0, help="seconds between the producer's lines")
+    run.add_argument("--trace", metavar="FILE.json", help="write per-action latencies and counters as JSON")
+
+    send = commands.add_parser("produce", help="send an action script line by line, like a live human")
+    send.add_argument("actions_file")
+    send.add_argument("--target", default='-', help="'-' for stdout (default), tcp:[HOST:]PORT, or a path")
+    send.add_argument("--delay", type=float, default=0.0, help="seconds between lines")
+    args = parser.parse_args()
+
+    if args.command == "produce":
+        produce(args.actions_file, args.target, args.delay)
+        sys.exit()
+
+    if args.producer:
+        if args.source == '-':
+            parser.error("--producer needs a --source other than stdin")
+        if not args.source.startswith('tcp:') and not os.path.exists(args.source):
+            os.mkfifo(args.source)
+        threading.Thread(target=produce, args=(args.producer, args.source, args.delay), daemon=True).start()
+    tracer = instrument.enable() if args.trace else None
+    run_online(args.grid_file, args.source, args.output, args.planner, args.sink)
+    if args.trace:
+        tracer.write_json(args.trace)
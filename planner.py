@@ -0,0 +1,139 @@
+import heapq
+import weakref
+from array import array
+
+# Generation counters wrap around after this many searches
+MAX_GENERATION = 2 ** 32 - 1
+
+
+# Path found by a PathPlanner. Its length is known straight away; the moves
+# are only rebuilt from the planner's parent array when they are first used,
+# or just before the planner starts its next search.
+class Path:
+    def __init__(self, planner, start, goal, length):
+        self.start = start
+        self.goal = goal
+        self.length = length
+        self._planner = planner
+        self._moves = None
+
+    def materialize(self):
+        if self._moves is None:
+            moves, toward = self._planner.grid.moves, self._planner.toward
+            path = []
+            current = self.goal
+            while current != self.start:
+                direction, step = moves[toward[current]]
+                path.append((direction, current))
+                current -= step
+            path.reverse()
+            self._moves = path
+            self._planner = None
+        return self._moves
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __getitem__(self, i):
+        return self.materialize()[i]
+
+    def __eq__(self, other):
+        return self.materialize() == list(other)
+
+    def __repr__(self):
+        return f"Path({self.materialize()!r})"
+
+
+# A* planner that owns flat cost, parent and visited arrays sized to the
+# grid. They are reused by every search: a cell's cost is only valid when
+# its visited entry holds the current search generation.
+class PathPlanner:
+    def __init__(self, grid):
+        self.grid = grid
+        self.g = array('i', bytes(4 * grid.size))
+        self.toward = bytearray(grid.size)  # index into grid.moves of the step into each cell
+        self.seen = array('I', bytes(4 * grid.size))
+        self.generation = 0
+        self.expanded = 0
+        self.pushes = 0
+        self.max_open = 0
+        self._pending = None
+
+    def _next_generation(self):
+        # The parent array is about to be overwritten
+        if self._pending is not None:
+            self._pending.materialize()
+            self._pending = None
+        if self.generation == MAX_GENERATION:
+            self.seen = array('I', bytes(4 * self.grid.size))
+            self.generation = 0
+        self.generation += 1
+        return self.generation
+
+    # Search from start to goal; return the path cost or None if unreachable
+    def search(self, start, goal, collected_keys):
+        grid = self.grid
+        cells, size, stride = grid.cells, grid.size, grid.stride
+        passable = grid.passable(collected_keys)
+        g, toward, seen = self.g, self.toward, self.seen
+        steps = [(i, step) for i, (_, step) in enumerate(grid.moves)]
+        gen = self._next_generation()
+        goal_row, goal_col = divmod(goal, stride)
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        row, col = divmod(start, stride)
+        seen[start] = gen
+        g[start] = 0
+        heap = [(abs(row - goal_row) + abs(col - goal_col), start, 0)]
+        expanded = pushes = max_open = 0
+        found = None
+        while heap:
+            _, current, cost = heappop(heap)
+            if current == goal:
+                found = cost
+                break
+            if cost > g[current]:
+                continue  # Stale entry, a cheaper one was already expanded
+            expanded += 1
+
+            new_cost = cost + 1
+            for i, step in steps:
+                neighbor = current + step
+                if 0 <= neighbor < size and passable[cells[neighbor]]:
+                    if seen[neighbor] != gen or new_cost < g[neighbor]:
+                        seen[neighbor] = gen
+                        g[neighbor] = new_cost
+                        toward[neighbor] = i
+                        row, col = divmod(neighbor, stride)
+                        heappush(heap, (new_cost + abs(row - goal_row) + abs(col - goal_col),
+                                        neighbor, new_cost))
+                        pushes += 1
+            if len(heap) > max_open:
+                max_open = len(heap)
+        self.expanded, self.pushes, self.max_open = expanded, pushes, max_open
+        return found
+
+    def distance(self, start, goal, collected_keys):
+        return self.search(start, goal, collected_keys)
+
+    # Same contract as find_path: the moves from start to goal, or [] if unreachable
+    def find_path(self, start, goal, collected_keys):
+        cost = self.search(start, goal, collected_keys)
+        if cost is None:
+            return []
+        self._pending = Path(self, start, goal, cost)
+        return self._pending
+
+
+_planners = weakref.WeakKeyDictionary()
+
+
+# Shared planner of a grid, created on first use
+def planner_for(grid):
+    planner = _planners.get(grid)
+    if planner is None:
+        planner = _planners[grid] = PathPlanner(grid)
+    return planner
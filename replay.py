@@ -0,0 +1,394 @@
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from actions import (DIRECTION_NAMES, MOVE, PICK_UP, REQUEST, REQUEST_BATCH, UNLOCK, UNLOCK_NEAREST,
+                     batch_requests, instructions, parse_actions)
+from batch import discover_cases, run_one
+from grid import PASSABLE, key_door_map, key_mask, load_grid
+from keyed import KeyedPlanner
+from P2_testing import PLANNERS, find_closest_door, result_path, update_human_position
+from sinks import TRACE_MAGIC, read_binary_trace
+
+# Every line the sinks write
+RESULT_LINE = re.compile(r'''(?:
+      Move\ (?P<move>UP|DOWN|LEFT|RIGHT)\ \((?P<row>\d+),\ (?P<col>\d+)\)
+    | (?P<position>My_position|Locate_human:)\ \((?P<at_row>\d+),\ (?P<at_col>\d+)\)
+    | (?P<move_to_human>Move_to_Human:)
+    | (?P<event>Pick_up|Drop|Unlock)_(?P<key>[A-Z])_(?:key|door)
+    )\s*$''', re.VERBOSE)
+DIRECTION_INDEX = {name: code for code, name in enumerate(DIRECTION_NAMES)}
+
+
+# Stream a text or binary result as (line number, kind, argument) tokens.
+# Moves carry (direction code, cell), positions a cell, events a key letter.
+def read_result(filename, stride):
+    with open(filename, 'rb') as file:
+        binary = file.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+    if binary:
+        lines = read_binary_trace(filename)
+    else:
+        lines = open(filename, 'r')
+    try:
+        for number, line in enumerate(lines, 1):
+            match = RESULT_LINE.match(line)
+            if match is None:
+                if line.strip():
+                    yield number, 'unknown', line.strip()
+            elif match.group('move'):
+                yield number, 'move', (DIRECTION_INDEX[match.group('move')],
+                                       int(match.group('row')) * stride + int(match.group('col')))
+            elif match.group('position'):
+                kind = 'my_position' if match.group('position') == 'My_position' else 'locate_human'
+                yield number, kind, int(match.group('at_row')) * stride + int(match.group('at_col'))
+            elif match.group('move_to_human'):
+                yield number, 'move_to_human', None
+            else:
+                yield number, match.group('event').lower(), match.group('key').lower()
+    finally:
+        if not binary:
+            lines.close()
+
+
+# Replays the instructions of an action file next to the result written for
+# them, on its own copy of the grid. The human and the doors follow the
+# simulation's rules; every line of the agent's response is checked: every
+# move goes one step from where the last one ended to the cell it names and
+# never into a wall or a door without its key, keys are only picked up where
+# an instance lies and only delivered at the human's position, and a request
+# goes unanswered only if no instance of its key can be brought to the human.
+# A ValueError names the first line that is wrong.
+class Replay:
+    def __init__(self, grid, agent_pos, human_pos, keys, tokens, name="result"):
+        self.grid = grid
+        self.agent_pos = agent_pos
+        self.human_pos = human_pos
+        self.keys = keys
+        self.collected_keys = set()
+        self.held = set()  # keys picked up on the way to others and not delivered yet
+        self.passable = PASSABLE[0]
+        self.tokens = tokens
+        self.ahead = deque()  # tokens read but not taken yet
+        self.name = name
+        self.number = 0
+        self.keyed = None
+        self.moves = 0
+        self.trips = []  # moves of every trip to fetch and deliver keys
+        self.skipped = 0  # requests for keys that could not be brought
+
+    def error(self, message):
+        raise ValueError(f"{self.name}:{self.number}: {message}")
+
+    def pos(self, idx):
+        return self.grid.pos(idx)
+
+    # Kind of the token i places ahead, or None past the end of the result
+    def peek(self, i=0):
+        while len(self.ahead) <= i:
+            token = next(self.tokens, None)
+            if token is None:
+                return None
+            self.ahead.append(token)
+        return self.ahead[i][1]
+
+    def take(self, kind=None, expected=None):
+        if self.peek() is None:
+            self.error(f"result ends, expected {expected or kind}")
+        self.number, token_kind, arg = self.ahead.popleft()
+        if token_kind == 'unknown':
+            self.error(f"unrecognized line: {arg}")
+        if kind is not None and token_kind != kind:
+            self.error(f"expected {expected or kind}, found {token_kind}")
+        return token_kind, arg
+
+    def _keys_changed(self):
+        self.passable = PASSABLE[key_mask(self.collected_keys)]
+
+    def start(self):
+        _, idx = self.take('my_position')
+        if idx != self.agent_pos:
+            self.error(f"agent starts at {self.pos(self.agent_pos)}, not {self.pos(idx)}")
+
+    def finish(self):
+        if self.peek() is not None:
+            self.take(expected="end of result")
+            self.error("line after the response to the last action")
+
+    def step(self, op, arg):
+        if op == MOVE:
+            self.human_pos = update_human_position(self.human_pos, 'Move', DIRECTION_NAMES[arg], self.grid)
+        elif op == REQUEST:
+            self.serve([chr(arg)])
+        elif op == REQUEST_BATCH:
+            self.serve([chr(code) for code in arg])
+        elif op == PICK_UP:
+            key = chr(arg)
+            _, picked = self.take('pick_up', f"Pick_up_{key.upper()}_key")
+            if picked != key:
+                self.error(f"picked up {picked.upper()}, the human handed over {key.upper()}")
+            self.keys.remove(key, self.human_pos)
+            self.collected_keys.add(key)
+            self._keys_changed()
+        elif op == UNLOCK:
+            key = chr(arg)
+            if key in self.collected_keys:
+                _, unlocked = self.take('unlock', f"Unlock_{key.upper()}_door")
+                if unlocked != key:
+                    self.error(f"unlocked a {unlocked.upper()} door, asked for {key.upper()}")
+                self.collected_keys.remove(key)
+                self.held.discard(key)
+                self._keys_changed()
+                _, door_pos = find_closest_door(self.human_pos, self.grid, key_door_map[key])
+                if door_pos is not None:
+                    self.grid.set_cell(door_pos, ord('.'))
+        elif op == UNLOCK_NEAREST:
+            door, _ = find_closest_door(self.human_pos, self.grid)
+            if door is not None:
+                self.step(REQUEST, ord(door.lower()))
+                self.step(UNLOCK, ord(door.lower()))
+
+    # Requested keys are delivered by the trips that follow, in any order and
+    # grouped in any way; the ones no trip delivers must be out of reach
+    def serve(self, requested):
+        pending = [key for key in requested if key in self.keys or key in self.held]
+        while pending:
+            # A key out of reach now is skipped, so a later trip delivering
+            # the same color belongs to a later request
+            for key in [key for key in pending if self._reachable(key) is None]:
+                pending.remove(key)
+                self.skipped += 1
+            drops = self._next_drops() if pending else None
+            if drops is None or (drops and not any(key in pending for key in drops)):
+                break
+            for key in self.trip(pending):
+                pending.remove(key)
+        # Whatever is left could have been brought
+        for key in pending:
+            self.error(self._reachable(key))
+
+    # Keys dropped by the trip the next lines start, [] if it is cut short or
+    # broken, None if they start no trip. A trip may begin with a pickup, but
+    # so does the response to the human handing over a key, so lines that
+    # begin with one only count as a trip if it is complete.
+    def _next_drops(self):
+        first = self.peek()
+        if first not in ('move', 'pick_up', 'locate_human'):
+            return None
+        i = 0
+        located = False
+        while True:
+            kind = self.peek(i)
+            if kind == 'locate_human' and not located:
+                located = True
+            elif kind == 'drop' and located:
+                break
+            elif not (kind in ('move', 'pick_up') or (kind == 'move_to_human' and located)):
+                return None if first == 'pick_up' else []
+            i += 1
+        drops = []
+        while self.peek(i) == 'drop':
+            drops.append(self.ahead[i][2])
+            i += 1
+        return drops
+
+    # Why the agent should have brought key, or None if it cannot be brought
+    def _reachable(self, key):
+        if self.keyed is None:
+            self.keyed = KeyedPlanner(self.grid, self.keys)
+        if key in self.held:
+            if self.keyed.plan(self.agent_pos, self.human_pos, self.collected_keys) is not None:
+                return f"the {key.upper()} key the agent holds was not brought to the human"
+            return None
+        for pos in self.keys.positions(key):
+            to_key = self.keyed.plan(self.agent_pos, pos, self.collected_keys)
+            if to_key is None:
+                continue
+            carried = self.collected_keys | {key} | {picked for _, picked, _ in to_key[1]}
+            if self.keyed.plan(pos, self.human_pos, carried) is not None:
+                return f"no {key.upper()} key was brought, though the one at {self.pos(pos)} can be"
+        return None
+
+    def move(self, direction, idx):
+        target = self.agent_pos + self.grid.moves[direction][1]
+        if target != idx:
+            self.error(f"agent is at {self.pos(self.agent_pos)}, so {DIRECTION_NAMES[direction]} "
+                       f"leads to {self.pos(target)}, not {self.pos(idx)}")
+        if not (0 <= idx < self.grid.size and self.passable[self.grid.cells[idx]]):
+            self.error(f"moved onto {self.grid.cell(idx)!r} at {self.pos(idx)}")
+        self.agent_pos = idx
+        self.moves += 1
+
+    def pick_up(self, key):
+        if not self.keys.remove(key, self.agent_pos):
+            self.error(f"no {key.upper()} key to pick up at {self.pos(self.agent_pos)}")
+        self.collected_keys.add(key)
+        self._keys_changed()
+
+    # Walk to the keys, then to the human and drop some of the wanted keys
+    # there: ones picked up on this trip or held from an earlier one. Keys
+    # picked up and not dropped are held. Returns the keys dropped.
+    def trip(self, wanted):
+        moves = self.moves
+        fetched = set(self.held)
+        while self.peek() != 'locate_human':
+            kind, arg = self.take(expected=f"moves to a {wanted[0].upper()} key")
+            if kind == 'move':
+                self.move(*arg)
+            elif kind == 'pick_up':
+                self.pick_up(arg)
+                fetched.add(arg)
+            else:
+                self.error(f"expected moves to a {wanted[0].upper()} key, found {kind}")
+        _, idx = self.take('locate_human')
+        if idx != self.human_pos:
+            self.error(f"human located at {self.pos(idx)}, they are at {self.pos(self.human_pos)}")
+        self.take('move_to_human')
+        while self.peek() in ('move', 'pick_up'):
+            kind, arg = self.take()
+            if kind == 'move':
+                self.move(*arg)
+            else:
+                self.pick_up(arg)
+                fetched.add(arg)
+
+        dropped = []
+        while self.peek() == 'drop':
+            _, key = self.take()
+            if key not in wanted or key in dropped or key not in fetched:
+                self.error(f"dropped a {key.upper()} key that was not fetched for the human")
+            if self.agent_pos != self.human_pos:
+                self.error(f"dropped {key.upper()} at {self.pos(self.agent_pos)}, "
+                           f"the human is at {self.pos(self.human_pos)}")
+            self.collected_keys.discard(key)
+            dropped.append(key)
+        if not dropped:
+            self.take('drop', f"Drop_{wanted[0].upper()}_key")
+        self.held = fetched - set(dropped)
+        self._keys_changed()
+        self.trips.append(self.moves - moves)
+        return dropped
+
+
+# Check one result against its grid and action file. batch must be the
+# --batch the result was made with. Returns a report with the error, if
+# any, the total moves and the moves of every trip.
+def validate(grid_file, actions_file, result_file, batch=1):
+    grid, agent_pos, human_pos, keys = load_grid(grid_file)
+    replay = Replay(grid, agent_pos, human_pos, keys, read_result(result_file, grid.stride), result_file)
+    stream = instructions(parse_actions(actions_file))
+    if batch > 1:
+        stream = batch_requests(stream, batch)
+    error = None
+    try:
+        replay.start()
+        for op, arg in stream:
+            replay.step(op, arg)
+        replay.finish()
+    except ValueError as e:
+        error = str(e)
+    return {'result': result_file, 'valid': error is None, 'error': error,
+            'moves': replay.moves, 'trips': replay.trips, 'skipped': replay.skipped}
+
+
+# Run one case with one planner in a worker and validate what it wrote
+def run_and_validate(case, results_dir, planner, batch=1):
+    number, grid_file, actions_file = case
+    planner_dir = os.path.join(results_dir, planner)
+    _, seconds, error = run_one(case, planner_dir, False, planner, 'text', batch)
+    if error:
+        report = {'result': None, 'valid': False, 'error': error, 'moves': 0, 'trips': [], 'skipped': 0}
+    else:
+        report = validate(grid_file, actions_file, result_path(grid_file, planner_dir), batch)
+    report.update(case=number, planner=planner, seconds=seconds)
+    return report
+
+
+# Run every case with two planners in parallel, validate every result and
+# compare the cost of every trip. Returns one entry per case.
+def diff_planners(input_dir="Input_files", baseline='fields', candidate='astar', workers=None, batch=1,
+                  results_dir=None):
+    cases = discover_cases(input_dir)
+    with tempfile.TemporaryDirectory() as scratch:
+        results_dir = results_dir or scratch
+        for planner in (baseline, candidate):
+            os.makedirs(os.path.join(results_dir, planner), exist_ok=True)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(pool.submit(run_and_validate, case, results_dir, baseline, batch),
+                        pool.submit(run_and_validate, case, results_dir, candidate, batch)) for case in cases]
+            pairs = [(a.result(), b.result()) for a, b in futures]
+
+    entries = []
+    for a, b in pairs:
+        differences = [(i, cost_a, cost_b) for i, (cost_a, cost_b) in enumerate(zip(a['trips'], b['trips']))
+                       if cost_a != cost_b]
+        entries.append({
+            'case': a['case'],
+            baseline: a,
+            candidate: b,
+            'equivalent': a['valid'] and b['valid'] and len(a['trips']) == len(b['trips']) and not differences,
+            'differences': differences,
+        })
+    return entries
+
+
+def print_diff(entries, baseline, candidate):
+    for entry in entries:
+        a, b = entry[baseline], entry[candidate]
+        line = f"Case {entry['case']}: {baseline} {a['moves']} moves, {candidate} {b['moves']} moves"
+        for name, report in ((baseline, a), (candidate, b)):
+            if not report['valid']:
+                line += f"; {name} INVALID: {report['error']}"
+        if a['valid'] and b['valid'] and len(a['trips']) != len(b['trips']):
+            line += f"; {len(a['trips'])} trips vs {len(b['trips'])}"
+        for i, cost_a, cost_b in entry['differences']:
+            line += f"; trip {i + 1}: {cost_a} vs {cost_b}"
+        print(line)
+    equivalent = sum(entry['equivalent'] for entry in entries)
+    print(f"{equivalent}/{len(entries)} cases valid with equal trip costs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python replay.py",
+                                     description="Validate result files and compare planners by their results")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check = commands.add_parser("check", help="validate one result against its grid and action file")
+    check.add_argument("grid_file")
+    check.add_argument("actions_file")
+    check.add_argument("result_file")
+    check.add_argument("--batch", type=int, default=1, metavar="N", help="--batch the result was made with")
+
+    diff = commands.add_parser("diff", help="run every case with two planners and compare trip costs")
+    diff.add_argument("baseline", choices=sorted(PLANNERS))
+    diff.add_argument("candidate", choices=sorted(PLANNERS))
+    diff.add_argument("--input-dir", default="Input_files")
+    diff.add_argument("--results-dir", help="keep the results here, one directory per planner")
+    diff.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    diff.add_argument("--batch", type=int, default=1, metavar="N",
+                      help="serve up to N consecutive key requests with one trip (default: 1, off)")
+    diff.add_argument("--json", metavar="FILE", help="also write the full comparison as JSON")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        report = validate(args.grid_file, args.actions_file, args.result_file, args.batch)
+        if report['valid']:
+            print(f"{args.result_file}: valid, {report['moves']} moves in {len(report['trips'])} trips, "
+                  f"{report['skipped']} requests for keys out of reach")
+        else:
+            print(report['error'])
+        sys.exit(0 if report['valid'] else 1)
+
+    if args.baseline == args.candidate:
+        parser.error("compare two different planners")
+    entries = diff_planners(args.input_dir, args.baseline, args.candidate, args.workers, args.batch,
+                            args.results_dir)
+    print_diff(entries, args.baseline, args.candidate)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(entries, file, indent=2)
+    sys.exit(0 if all(entry['equivalent'] for entry in entries) else 1)
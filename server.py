@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from actions import MOVE, parse_line
+from components import components_for
+from distances import DistanceCache
+from grid import Grid, load_grid
+from keyindex import KeyIndex
+from P2_testing import PLANNERS, simulation
+from sinks import TextSink
+
+DEFAULT_PORT = 5078
+# Written after the agent's response to every line a client sends
+DONE = b"Done\n"
+
+
+# A grid loaded once and shared by every session. Sessions get their own
+# copy of the cells, since the human moves and doors open, but start from
+# the positions, component labels and distance fields found here: these are
+# never modified, a session copies whatever its own grid changes under it.
+class SharedGrid:
+    def __init__(self, grid_file, planner='astar'):
+        grid, self.agent_pos, self.human_pos, keys = load_grid(grid_file)
+        self.cells = bytes(grid.cells)
+        self.shape = (grid.rows, grid.cols, grid.stride, grid.size)
+        self.keys = [(chr(grid.cells[idx]), idx) for idx in keys.instances()]
+        # Tuples, so that a session has to copy a row before editing it
+        parent, starts, ends, ids, doors = components_for(grid).state()
+        self.components = (tuple(parent), *([tuple(row) for row in runs] for runs in (starts, ends, ids)),
+                           doors)
+        self.planner = planner
+        self.fields = {}
+        self.sources = set()
+        if PLANNERS[planner] is DistanceCache:
+            cache = DistanceCache(grid)
+            cache.precompute([self.agent_pos] + keys.instances() + grid.doors())
+            self.fields, self.sources = cache.fields, cache.sources
+
+    def session(self):
+        grid = Grid(bytearray(self.cells), *self.shape)
+        components_for(grid, (self.components[0], *(list(runs) for runs in self.components[1:4]),
+                              self.components[4]))
+        keys = KeyIndex(grid)
+        for key, idx in self.keys:
+            keys.add(key, idx)
+        planner = PLANNERS[self.planner](grid)
+        if isinstance(planner, DistanceCache):
+            planner.fields = dict(self.fields)
+            planner.sources = set(self.sources)
+        return grid, self.agent_pos, self.human_pos, keys, planner
+
+
+# One client connection: each line is simulated as it arrives; setting the
+# session up and anything but a move run in the thread pool so a long search
+# never blocks other sessions
+async def handle_session(shared, pool, reader, writer):
+    loop = asyncio.get_running_loop()
+    buffer = io.StringIO()
+    steps = sink = None
+
+    def step(instruction):
+        if instruction is not None:
+            steps.send(instruction)
+        sink.flush()
+        output = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return output.encode()
+
+    # Copying the grid is no work for the event loop either
+    def start():
+        nonlocal steps, sink
+        grid, agent_pos, human_pos, keys, planner = shared.session()
+        sink = TextSink(buffer, grid.stride)
+        steps = simulation(grid, agent_pos, human_pos, keys, sink, planner)
+        next(steps)
+        return step(None)
+
+    try:
+        writer.write(await loop.run_in_executor(pool, start))
+        number = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            number += 1
+            instruction = parse_line(line, "session", number)
+            if instruction is None or instruction[0] == MOVE:
+                output = step(instruction)
+            else:
+                output = await loop.run_in_executor(pool, step, instruction)
+            writer.write(output + DONE)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        if steps is not None:
+            steps.close()
+        writer.close()
+
+
+async def serve(grid_file, host='127.0.0.1', port=DEFAULT_PORT, planner='astar', workers=None):
+    shared = SharedGrid(grid_file, planner)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_session(shared, pool, reader, writer), host, port)
+        print(f"Serving {grid_file} on {host}:{port}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+# Load generator: one client session replaying an action script. Returns
+# the latency of every line and the agent's output without the Done markers.
+async def run_session(host, port, lines):
+    reader, writer = await asyncio.open_connection(host, port)
+    output, latencies = [], []
+    try:
+        for line in lines:
+            started = time.perf_counter()
+            writer.write(line)
+            await writer.drain()
+            while True:
+                reply = await reader.readline()
+                if not reply:
+                    raise ConnectionError("server closed the session")
+                if reply == DONE:
+                    break
+                output.append(reply)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return latencies, b''.join(output)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def load(actions_file, host='127.0.0.1', port=DEFAULT_PORT, sessions=100, concurrency=50):
+    with open(actions_file, 'rb') as file:
+        lines = [line.rstrip(b'\r\n') + b'\n' for line in file if line.strip()]
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with limit:
+            return await run_session(host, port, lines)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(sessions)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    failures = [result for result in results if isinstance(result, BaseException)]
+    finished = [result for result in results if not isinstance(result, BaseException)]
+    latencies = [latency for session_latencies, _ in finished for latency in session_latencies]
+    outputs = {output for _, output in finished}
+    return {
+        'sessions': sessions,
+        'concurrency': concurrency,
+        'failed': len(failures),
+        'seconds': elapsed,
+        'sessions_per_second': len(finished) / elapsed if elapsed > 0 else 0.0,
+        'actions': len(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000,
+        # Every session replays the same script, so their results should agree
+        'distinct_outputs': len(outputs),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python server.py",
+                                     description="Host many agent sessions on one shared grid")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("serve", help="serve sessions on a grid")
+    run.add_argument("grid_file")
+    run.add_argument("--host", default='127.0.0.1')
+    run.add_argument("--port", type=int, default=DEFAULT_PORT)
+    run.add_argument("--planner", choices=sorted(PLANNERS), default='astar')
+    run.add_argument("--workers", type=int, default=None, help="planning threads (default: Python's choice)")
+
+    generate = commands.add_parser("load", help="replay an action script from many concurrent sessions")
+    generate.add_argument("actions_file")
+    generate.add_argument("--host", default='127.0.0.1')
+    generate.add_argument("--port", type=int, default=DEFAULT_PORT)
+    generate.add_argument("--sessions", type=int, default=100)
+    generate.add_argument("--concurrency", type=int, default=50, help="sessions open at the same time")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.grid_file, args.host, args.port, args.planner, args.workers))
+        except KeyboardInterrupt:
+            pass
+    else:
+        report = asyncio.run(load(args.actions_file, args.host, args.port, args.sessions, args.concurrency))
+        json.dump(report, sys.stdout, indent=2)
+        print()
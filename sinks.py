@@ -0,0 +1,184 @@
+import struct
+
+# Binary trace: a header followed by fixed-width records of
+# (opcode, argument, row, col). Unused fields are zero / -1.
+TRACE_MAGIC = b'GHT1'
+RECORD = struct.Struct('<BBii')
+
+MY_POSITION, HUMAN_POSITION, MOVE, PICK_UP, LOCATE_HUMAN, MOVE_TO_HUMAN, DROP, UNLOCK = range(1, 9)
+DIRECTION_CODES = {'UP': 0, 'DOWN': 1, 'LEFT': 2, 'RIGHT': 3}
+DIRECTION_NAMES = {code: name for name, code in DIRECTION_CODES.items()}
+
+
+# Open a result file for writing, or use an already open file object
+def _open(target, mode):
+    if hasattr(target, 'write'):
+        return target, False
+    return open(target, mode), True
+
+
+# Writes the Results/*_result.txt text format, joining lines in a buffer
+# and writing them in large blocks
+class TextSink:
+    def __init__(self, target, stride, buffer_lines=4096):
+        self.file, self._owned = _open(target, 'w')
+        self.stride = stride
+        self.buffer_lines = buffer_lines
+        self.lines = []
+        self.move_prefix = {name: f"Move {name} (" for name in DIRECTION_CODES}
+
+    def _write(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.buffer_lines:
+            self.flush()
+
+    def _pos(self, idx):
+        row, col = divmod(idx, self.stride)
+        return f"({row}, {col})"
+
+    def my_position(self, idx):
+        self._write(f"My_position {self._pos(idx)}\n")
+
+    def human_position(self, idx):
+        self._write(f"Human_position {self._pos(idx)}\n")
+
+    def moves(self, path):
+        stride, prefix = self.stride, self.move_prefix
+        lines = self.lines
+        for direction, idx in path:
+            row, col = divmod(idx, stride)
+            lines.append(f"{prefix[direction]}{row}, {col})\n")
+        if len(lines) >= self.buffer_lines:
+            self.flush()
+
+    def pick_up(self, key):
+        self._write(f"Pick_up_{key.upper()}_key\n")
+
+    def locate_human(self, idx):
+        self._write(f"Locate_human: {self._pos(idx)}\n")
+
+    def move_to_human(self):
+        self._write("Move_to_Human:\n")
+
+    def drop(self, key):
+        self._write(f"Drop_{key.upper()}_key\n")
+
+    def unlock(self, key):
+        self._write(f"Unlock_{key.upper()}_door\n")
+
+    def flush(self):
+        if self.lines:
+            self.file.write(''.join(self.lines))
+            self.lines = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Writes the same events as fixed-width binary records
+class BinarySink(TextSink):
+    def __init__(self, target, stride, buffer_lines=4096):
+        self.file, self._owned = _open(target, 'wb')
+        self.stride = stride
+        self.buffer_lines = buffer_lines
+        self.lines = []
+        self.file.write(TRACE_MAGIC)
+
+    def _record(self, opcode, arg=0, idx=None):
+        row, col = divmod(idx, self.stride) if idx is not None else (-1, -1)
+        self._write(RECORD.pack(opcode, arg, row, col))
+
+    def my_position(self, idx):
+        self._record(MY_POSITION, idx=idx)
+
+    def human_position(self, idx):
+        self._record(HUMAN_POSITION, idx=idx)
+
+    def moves(self, path):
+        stride, pack, lines = self.stride, RECORD.pack, self.lines
+        for direction, idx in path:
+            row, col = divmod(idx, stride)
+            lines.append(pack(MOVE, DIRECTION_CODES[direction], row, col))
+        if len(lines) >= self.buffer_lines:
+            self.flush()
+
+    def pick_up(self, key):
+        self._record(PICK_UP, ord(key))
+
+    def locate_human(self, idx):
+        self._record(LOCATE_HUMAN, idx=idx)
+
+    def move_to_human(self):
+        self._record(MOVE_TO_HUMAN)
+
+    def drop(self, key):
+        self._record(DROP, ord(key))
+
+    def unlock(self, key):
+        self._record(UNLOCK, ord(key))
+
+    def flush(self):
+        if self.lines:
+            self.file.write(b''.join(self.lines))
+            self.lines = []
+        self.file.flush()
+
+
+# Discards everything, to time the planners on their own
+class NullSink:
+    def __init__(self, target=None, stride=None):
+        pass
+
+    def _discard(self, *args):
+        pass
+
+    my_position = human_position = moves = pick_up = locate_human = _discard
+    move_to_human = drop = unlock = flush = close = _discard
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+SINKS = {'text': TextSink, 'binary': BinarySink, 'null': NullSink}
+
+
+# Decode a binary trace back into the lines of the text format
+def read_binary_trace(filename):
+    with open(filename, 'rb') as file:
+        if file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{filename} is not a binary result trace")
+        while True:
+            record = file.read(RECORD.size)
+            if len(record) < RECORD.size:
+                return
+            opcode, arg, row, col = RECORD.unpack(record)
+            if opcode == MY_POSITION:
+                yield f"My_position {(row, col)}"
+            elif opcode == HUMAN_POSITION:
+                yield f"Human_position {(row, col)}"
+            elif opcode == MOVE:
+                yield f"Move {DIRECTION_NAMES[arg]} {(row, col)}"
+            elif opcode == PICK_UP:
+                yield f"Pick_up_{chr(arg).upper()}_key"
+            elif opcode == LOCATE_HUMAN:
+                yield f"Locate_human: {(row, col)}"
+            elif opcode == MOVE_TO_HUMAN:
+                yield "Move_to_Human:"
+            elif opcode == DROP:
+                yield f"Drop_{chr(arg).upper()}_key"
+            elif opcode == UNLOCK:
+                yield f"Unlock_{chr(arg).upper()}_door"
+            else:
+                raise ValueError(f"{filename}: unknown record opcode {opcode}")
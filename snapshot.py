@@ -0,0 +1,184 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from components import components_for
+from distances import DistanceCache, DistanceField
+from grid import CELL_CLASS, DOOR, Grid, load_grid, load_grid_mmap
+from keyindex import KeyIndex
+
+# Snapshot layout: a header, a table of sections, then the sections
+# themselves, each starting on an 8 byte boundary. Every section is used in
+# place through a view of the mapped file, so loading parses nothing but the
+# header and the table.
+MAGIC = b'GHS1'
+VERSION = 1
+# magic, version, sections, rows, cols, stride, size, agent, human, source mtime (ns), source size
+HEADER = struct.Struct('<4sII8q')
+# tag, number (distance field index), offset, length
+SECTION = struct.Struct('<4sIQQ')
+# source, key mask, cells reached of one distance field
+FIELD = struct.Struct('<3q')
+ALIGN = 8
+
+
+# Snapshot file kept next to a grid file
+def snapshot_path(grid_file):
+    return grid_file + '.snap'
+
+
+# Write the grid, its key positions, its component labels and the distance
+# fields of planner (a DistanceCache) so load_snapshot can use them as is
+def save_snapshot(filename, grid, agent_pos, human_pos, keys, source_file, planner=None):
+    components = components_for(grid)
+    parent, starts, ends, ids, doors = components.state()
+    row_offsets = array('I', [0])
+    for row in starts:
+        row_offsets.append(row_offsets[-1] + len(row))
+    key_colors = bytearray()
+    key_positions = array('I')
+    for idx in keys.instances():
+        key_colors.append(grid.cells[idx])
+        key_positions.append(idx)
+
+    sections = [
+        (b'CELL', 0, memoryview(grid.cells)[:grid.size]),
+        (b'KEYC', 0, key_colors),
+        (b'KEYP', 0, key_positions),
+        (b'PARN', 0, array('I', parent)),
+        (b'ROWS', 0, row_offsets),
+        (b'STRT', 0, array('I', (start for row in starts for start in row))),
+        (b'ENDS', 0, array('I', (end for row in ends for end in row))),
+        (b'IDS_', 0, array('I', (node for row in ids for node in row))),
+        (b'DOOR', 0, array('I', (value for idx, (node, _) in doors.items() for value in (idx, node)))),
+    ]
+    if isinstance(planner, DistanceCache):
+        for number, ((source, mask), field) in enumerate(planner.fields.items()):
+            sections += [
+                (b'FLDH', number, FIELD.pack(source, mask, field.reached)),
+                (b'DIST', number, array('i', field.dist)),
+                (b'TOWD', number, field.toward),
+                (b'BLKD', number, array('I', sorted(field.blocked))),
+            ]
+
+    stat = os.stat(source_file)
+    header = HEADER.pack(MAGIC, VERSION, len(sections), grid.rows, grid.cols, grid.stride, grid.size,
+                         -1 if agent_pos is None else agent_pos, -1 if human_pos is None else human_pos,
+                         stat.st_mtime_ns, stat.st_size)
+    offset = _aligned(HEADER.size + SECTION.size * len(sections))
+    table = []
+    for tag, number, data in sections:
+        length = memoryview(data).nbytes
+        table.append(SECTION.pack(tag, number, offset, length))
+        offset = _aligned(offset + length)
+
+    # Write next to the old snapshot and swap, since a run may still have it mapped
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(header)
+        file.write(b''.join(table))
+        for tag, number, data in sections:
+            file.write(b'\0' * (_aligned(file.tell()) - file.tell()))
+            file.write(data)
+    os.replace(temporary, filename)
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+# Header of a snapshot as a tuple in HEADER order; raises ValueError if the
+# file is not a snapshot this version can read
+def read_header(filename):
+    with open(filename, 'rb') as file:
+        data = file.read(HEADER.size)
+    if len(data) < HEADER.size or data[:4] != MAGIC:
+        raise ValueError(f"{filename}: not a grid snapshot")
+    header = HEADER.unpack(data)
+    if header[1] != VERSION:
+        raise ValueError(f"{filename}: snapshot version {header[1]}, expected {VERSION}")
+    return header
+
+
+# Map a snapshot copy-on-write and build the grid on top of it. Returns
+# (grid, agent_pos, human_pos, keys, fields) like load_grid plus the
+# distance fields by (source, key mask); the grid's component labels are
+# restored as well.
+def load_snapshot(filename):
+    (_, _, count, rows, cols, stride, size, agent_pos, human_pos, _, _) = read_header(filename)
+    with open(filename, 'rb') as file:
+        view = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY))
+    sections = {}
+    for i in range(count):
+        tag, number, offset, length = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+        sections[(tag, number)] = view[offset:offset + length]
+
+    grid = Grid(sections[(b'CELL', 0)], rows, cols, stride, size)
+    keys = KeyIndex(grid)
+    for color, idx in zip(bytes(sections[(b'KEYC', 0)]), sections[(b'KEYP', 0)].cast('I')):
+        keys.add(chr(color), idx)
+
+    # Component labels: one view per row into the flat run arrays
+    row_offsets = sections[(b'ROWS', 0)].cast('I')
+    runs = []
+    for tag in (b'STRT', b'ENDS', b'IDS_'):
+        flat = sections[(tag, 0)].cast('I')
+        runs.append([flat[row_offsets[row]:row_offsets[row + 1]] for row in range(rows)])
+    doors = {}
+    door_nodes = sections[(b'DOOR', 0)].cast('I')
+    for i in range(0, len(door_nodes), 2):
+        idx = door_nodes[i]
+        doors[idx] = (door_nodes[i + 1], 1 << (CELL_CLASS[grid.cells[idx]] - DOOR))
+    components_for(grid, (sections[(b'PARN', 0)].cast('I'), *runs, doors))
+
+    fields = {}
+    number = 0
+    while (b'FLDH', number) in sections:
+        source, mask, reached = FIELD.unpack(sections[(b'FLDH', number)])
+        fields[(source, mask)] = DistanceField(source, sections[(b'DIST', number)].cast('i'),
+                                               sections[(b'TOWD', number)],
+                                               set(sections[(b'BLKD', number)].cast('I')), reached)
+        number += 1
+    return (grid, agent_pos if agent_pos >= 0 else None, human_pos if human_pos >= 0 else None,
+            keys, fields)
+
+
+# Snapshot of grid_file if one exists and was made from the file as it is
+# now, else None. A stale or unreadable snapshot is reported and ignored.
+def load_fresh(grid_file):
+    filename = snapshot_path(grid_file)
+    if not os.path.exists(filename):
+        return None
+    try:
+        header = read_header(filename)
+    except (OSError, ValueError) as error:
+        print(f"Warning: ignoring snapshot: {error}", file=sys.stderr)
+        return None
+    stat = os.stat(grid_file)
+    if header[9:] != (stat.st_mtime_ns, stat.st_size):
+        print(f"Warning: {filename} is stale, reading {grid_file}", file=sys.stderr)
+        return None
+    return load_snapshot(filename)
+
+
+# Load a grid file, compute the distance fields run_case would and save it all
+def create(grid_file, use_mmap=False):
+    grid, agent_pos, human_pos, keys = load_grid_mmap(grid_file) if use_mmap else load_grid(grid_file)
+    planner = DistanceCache(grid)
+    planner.precompute(([agent_pos] if agent_pos is not None else []) + keys.instances() + grid.doors())
+    save_snapshot(snapshot_path(grid_file), grid, agent_pos, human_pos, keys, grid_file, planner)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(prog="python snapshot.py",
+                                     description="Save grid files as binary snapshots next to them")
+    parser.add_argument("grid_files", nargs='+')
+    parser.add_argument("--mmap", action="store_true",
+                        help="memory-map the grid file instead of reading it line by line")
+    args = parser.parse_args()
+    for grid_file in args.grid_files:
+        create(grid_file, args.mmap)
+        print(f"{grid_file} -> {snapshot_path(grid_file)}", file=sys.stderr)
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from P2_testing import run_case
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The red key is walled off, so its request fails with a warning; the green
+# one is delivered
+GRID = ['m.Wr',
+        'WWWW',
+        'h..g']
+ACTIONS = ['Request: red', 'Instruction: Can you pass me the purple key?', 'Request: green']
+
+
+# Warnings go to stderr, so the result stream on stdout matches a batch run
+@pytest.mark.parametrize('sink', ['text', 'binary'])
+def test_warnings_stay_out_of_the_stream(tmp_path, sink):
+    grid_file, actions_file = tmp_path / '1_grid.txt', tmp_path / '1_human.txt'
+    grid_file.write_text('\n'.join(GRID) + '\n')
+    actions_file.write_text('\n'.join(ACTIONS) + '\n')
+    result_file = tmp_path / 'result'
+    run_case(str(grid_file), str(actions_file), str(result_file), sink=sink, snapshot=False)
+
+    online = subprocess.run([sys.executable, os.path.join(ROOT, 'online.py'), 'run', str(grid_file),
+                             '--sink', sink, '--output', '-'],
+                            input=actions_file.read_bytes(), capture_output=True, cwd=tmp_path, check=True)
+    assert online.stdout == result_file.read_bytes()
+    assert b'Warning: no route to bring the r key' in online.stderr
+    assert b'no key color in instruction' in online.stderr
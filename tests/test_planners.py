@@ -0,0 +1,355 @@
+import functools
+import itertools
+import random
+
+import pytest
+
+from components import Components
+import distances
+from distances import DistanceCache
+from dstar import IncrementalPlanner
+from grid import KEY_BITS, KEY_COLORS, PASSABLE, Grid, key_door_map, key_mask, locate
+from hpa import HierarchicalPlanner
+from jps import JumpPointPlanner
+from keyed import KeyedPlanner
+from planner import PathPlanner
+import tours
+from tours import TourPlanner
+
+SEEDS = range(20)
+
+
+# Random grid with walls, doors of every color and a few keys
+def random_grid(seed, rows=None, cols=None, walls=0.3, doors=0.06, keys=0.03):
+    rng = random.Random(seed)
+    rows = rows or rng.randint(6, 18)
+    cols = cols or rng.randint(6, 18)
+    lines = []
+    for _ in range(rows):
+        line = []
+        for _ in range(cols):
+            roll = rng.random()
+            if roll < walls:
+                line.append('W')
+            elif roll < walls + doors:
+                line.append(key_door_map[rng.choice(KEY_COLORS)])
+            elif roll < walls + doors + keys:
+                line.append(rng.choice(KEY_COLORS))
+            else:
+                line.append('.')
+        lines.append(''.join(line))
+    return Grid.from_rows(lines), rng
+
+
+def open_cells(grid, mask=0):
+    passable = PASSABLE[mask]
+    return [idx for idx in range(grid.size) if passable[grid.cells[idx]]]
+
+
+# Reference breadth-first distance, None if goal cannot be reached
+def bfs_distance(grid, start, goal, mask=0):
+    passable = PASSABLE[mask]
+    steps = [step for _, step in grid.moves]
+    dist = {start: 0}
+    frontier = [start]
+    while frontier and goal not in dist:
+        next_frontier = []
+        for current in frontier:
+            for step in steps:
+                neighbor = current + step
+                if 0 <= neighbor < grid.size and neighbor not in dist and passable[grid.cells[neighbor]]:
+                    dist[neighbor] = dist[current] + 1
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+    return dist.get(goal)
+
+
+# Every move goes one step in its direction onto a cell that can be entered
+def assert_valid_path(grid, start, goal, path, mask=0):
+    steps = dict(grid.moves)
+    current = start
+    for direction, idx in path:
+        assert idx == current + steps[direction]
+        assert 0 <= idx < grid.size and PASSABLE[mask][grid.cells[idx]]
+        current = idx
+    assert current == goal
+
+
+# Start and goal pairs on a random grid, with a random key set per pair
+def queries(grid, rng, count=40):
+    cells = open_cells(grid)
+    for _ in range(count if len(cells) > 1 else 0):
+        start, goal = rng.sample(cells, 2)
+        mask = rng.randrange(16)
+        yield start, goal, mask, [key for i, key in enumerate(KEY_COLORS) if mask & (1 << i)]
+
+
+# A planner must find a valid shortest path whenever one exists, and none otherwise
+def assert_shortest(make_planner, seed):
+    grid, rng = random_grid(seed)
+    planner = make_planner(grid)
+    for start, goal, mask, keys in queries(grid, rng):
+        expected = bfs_distance(grid, start, goal, mask)
+        path = planner.find_path(start, goal, keys)
+        if expected is None:
+            assert path == []
+        else:
+            assert len(path) == expected
+            assert_valid_path(grid, start, goal, path, mask)
+            assert planner.distance(start, goal, keys) == expected
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_astar_is_shortest(seed):
+    assert_shortest(PathPlanner, seed)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_distance_fields_are_shortest(seed):
+    assert_shortest(DistanceCache, seed)
+
+
+# The NumPy wavefront must give the same distances as the pure Python one,
+# from several sources at once and with any key set
+@pytest.mark.skipif(distances.np is None, reason="NumPy is not installed")
+@pytest.mark.parametrize('seed', SEEDS)
+def test_numpy_wavefront_matches_python(seed):
+    grid, rng = random_grid(seed)
+    cells = open_cells(grid)
+    for mask in range(16):
+        keys = [key for i, key in enumerate(KEY_COLORS) if mask & (1 << i)]
+        sources = rng.sample(cells, min(rng.randint(1, 4), len(cells)))
+        expected = distances._wavefront_python(grid, sources, keys)
+        assert distances.wavefront(grid, sources, keys).tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_dstar_lite_is_shortest(seed):
+    assert_shortest(IncrementalPlanner, seed)
+
+
+# Sixteen key sets against four kept jump tables, so they are evicted too
+@pytest.mark.parametrize('seed', SEEDS)
+def test_jump_point_search_is_shortest(seed):
+    assert_shortest(JumpPointPlanner, seed)
+
+
+# D* Lite repairs its trees and JPS drops its jumps rather than starting
+# over, so keep querying towards a few goals from moving starts while doors
+# open and walls go up. JPS also runs keeping every key set's jumps, so that
+# none are evicted before a change reaches them.
+@pytest.mark.parametrize('make_planner', [IncrementalPlanner, JumpPointPlanner,
+                                          functools.partial(JumpPointPlanner, max_masks=16)])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_planner_follows_changes(make_planner, seed):
+    grid, rng = random_grid(seed)
+    planner = make_planner(grid)
+    cells = open_cells(grid)
+    if len(cells) < 2:
+        return
+    goals = rng.sample(cells, min(3, len(cells)))
+    changes = [(door, '.') for door in grid.doors()]
+    changes += [(cell, 'W') for cell in rng.sample(cells, len(cells) // 10) if cell not in goals]
+    rng.shuffle(changes)
+    for change in changes + [None]:
+        for _ in range(10):
+            start, goal = rng.choice(cells), rng.choice(goals)
+            mask = rng.randrange(16)
+            keys = [key for i, key in enumerate(KEY_COLORS) if mask & (1 << i)]
+            expected = bfs_distance(grid, start, goal, mask)
+            path = planner.find_path(start, goal, keys)
+            if expected is None:
+                assert path == []
+            else:
+                assert len(path) == expected
+                assert_valid_path(grid, start, goal, path, mask)
+        if change is not None:
+            cell, value = change
+            grid.set_cell(cell, ord(value))
+            if value == 'W':
+                cells.remove(cell)
+            else:
+                cells.append(cell)
+
+
+# Opening a door keeps the jumps of key sets that could already pass it and,
+# for the others, the horizontal jumps in rows away from it
+def test_jump_point_search_keeps_unaffected_jumps():
+    grid = Grid.from_rows(['.....',
+                           '.....',
+                           'WWBWW',
+                           '.....',
+                           '.....'])
+    planner = JumpPointPlanner(grid)
+    start, goal, door = grid.index((0, 0)), grid.index((4, 4)), grid.index((2, 2))
+    assert len(planner.find_path(start, goal, ['b'])) == 8
+    assert planner.find_path(start, goal, []) == []
+    blue = planner.jumps[key_mask(['b'])][1]
+    kept = {step: list(lines) for step, lines in blue.items()}
+    opened, jumps = planner.jumps[key_mask([])]
+    first_row = jumps[1][0]
+    assert first_row is not None
+
+    grid.set_cell(door, ord('.'))
+    assert {step: list(lines) for step, lines in blue.items()} == kept
+    assert opened[door + grid.stride] == 1
+    assert jumps[1][0] is first_row
+    assert jumps[1][1:4] == [None] * 3 and jumps[grid.stride] == [None] * grid.stride
+    assert len(planner.find_path(start, goal, [])) == 8
+
+
+# HPA* paths may be longer than the shortest, but they must be valid and
+# exist exactly when one exists, also after doors open
+@pytest.mark.parametrize('seed', SEEDS)
+def test_hpa_paths_are_valid(seed):
+    grid, rng = random_grid(seed, walls=0.2)
+    planner = HierarchicalPlanner(grid, cluster_size=4)
+    doors = grid.doors()
+    rng.shuffle(doors)
+    for door in doors[:3] + [None]:
+        for start, goal, mask, keys in queries(grid, rng, 20):
+            expected = bfs_distance(grid, start, goal, mask)
+            path = planner.find_path(start, goal, keys)
+            if expected is None:
+                assert path == []
+            else:
+                assert len(path) >= expected
+                assert_valid_path(grid, start, goal, path, mask)
+                assert planner.distance(start, goal, keys) == len(path)
+        if door is not None:
+            grid.set_cell(door, ord('.'))
+
+
+# Component labels must agree with BFS reachability for every key set,
+# while doors open (joined in place) and walls go up (relabelled)
+@pytest.mark.parametrize('seed', SEEDS)
+def test_components_match_bfs(seed):
+    grid, rng = random_grid(seed)
+    components = Components(grid)
+    cells = open_cells(grid)
+    changes = [(door, '.') for door in grid.doors()] + [(cell, 'W') for cell in rng.sample(cells, 3)]
+    rng.shuffle(changes)
+    for change in changes + [None]:
+        for start, goal, mask, keys in queries(grid, rng, 20):
+            reachable = bfs_distance(grid, start, goal, mask) is not None
+            assert components.reachable(start, goal, keys) == reachable
+        if change is not None:
+            grid.set_cell(change[0], ord(change[1]))
+
+
+# Reference search over (cell, keys carried) states
+def keyed_distance(grid, start, goal, mask):
+    key_bits = {idx: KEY_BITS[chr(grid.cells[idx])] for idx in range(grid.size)
+                if chr(grid.cells[idx]) in KEY_BITS}
+    steps = [step for _, step in grid.moves]
+    seen = {(start, mask)}
+    frontier = [(start, mask)]
+    distance = 0
+    while frontier:
+        if any(cell == goal for cell, _ in frontier):
+            return distance
+        distance += 1
+        next_frontier = []
+        for cell, mask in frontier:
+            for step in steps:
+                neighbor = cell + step
+                if 0 <= neighbor < grid.size and PASSABLE[mask][grid.cells[neighbor]]:
+                    state = (neighbor, mask | key_bits.get(neighbor, 0))
+                    if state not in seen:
+                        seen.add(state)
+                        next_frontier.append(state)
+        frontier = next_frontier
+    return None
+
+
+# The keyed planner fetches keys on the way when doors block the goal
+@pytest.mark.parametrize('seed', SEEDS)
+def test_keyed_planner_is_shortest(seed):
+    grid, rng = random_grid(seed, walls=0.25, doors=0.1, keys=0.04)
+    _, _, _, keys = locate(grid)
+    planner = KeyedPlanner(grid, keys)
+    for start, goal, mask, collected in queries(grid, rng, 30):
+        expected = keyed_distance(grid, start, goal, mask)
+        result = planner.plan(start, goal, collected)
+        if expected is None:
+            assert result is None
+            continue
+        moves, pickups = result
+        assert len(moves) == expected
+        # Every step is valid with the keys picked up before it
+        current, carried = start, mask
+        picked = {i: key for i, key, _ in pickups}
+        for i, (direction, idx) in enumerate(moves):
+            assert idx == current + dict(grid.moves)[direction]
+            assert PASSABLE[carried][grid.cells[idx]]
+            if i in picked:
+                assert chr(grid.cells[idx]) == picked[i]
+                carried |= KEY_BITS[picked[i]]
+            current = idx
+        assert current == goal
+
+
+# With room for only a few distance fields the tour is planned greedily
+# and never keeps more fields than that; its cost must still be that of
+# its route
+@pytest.mark.parametrize('seed', SEEDS)
+def test_tour_keeps_fields_within_budget(seed, monkeypatch):
+    grid, rng = random_grid(seed, walls=0.2, doors=0.08, keys=0.04)
+    _, _, _, keys = locate(grid)
+    colors = [key for key in KEY_COLORS if key in keys]
+    cells = open_cells(grid)
+    if not colors or len(cells) < 2:
+        return
+    monkeypatch.setattr(tours, 'FIELD_CELLS', 2 * grid.size)
+    planner = TourPlanner(grid)
+    kept = []
+    compute = tours.wavefront
+
+    def wavefront(*args):
+        kept.append(len(planner.fields))
+        return compute(*args)
+
+    monkeypatch.setattr(tours, 'wavefront', wavefront)
+    for _ in range(5):
+        start, goal = rng.sample(cells, 2)
+        wanted = rng.sample(colors, rng.randint(1, min(3, len(colors))))
+        tour = planner.plan(start, goal, wanted, keys, ())
+        if tour:
+            cost, position, mask = 0, start, 0
+            for key, pos in tour[1]:
+                cost, position, mask = cost + bfs_distance(grid, position, pos, mask), pos, mask | KEY_BITS[key]
+            assert tour[0] == cost + bfs_distance(grid, position, goal, mask)
+    assert max(kept) <= 2 and not planner.fields
+
+
+# With few instances per color the tour is exact: compare with trying every
+# order of the keys and every instance of each
+@pytest.mark.parametrize('seed', SEEDS)
+def test_tour_is_cheapest(seed):
+    grid, rng = random_grid(seed, walls=0.2, doors=0.08, keys=0.04)
+    _, _, _, keys = locate(grid)
+    colors = [key for key in KEY_COLORS if key in keys and len(keys.positions(key)) <= 3]
+    cells = open_cells(grid)
+    if not colors or len(cells) < 2:
+        return
+    tours = TourPlanner(grid)
+    for _ in range(5):
+        start, goal = rng.sample(cells, 2)
+        wanted = rng.sample(colors, rng.randint(1, min(3, len(colors))))
+        best = None
+        for order in itertools.permutations(wanted):
+            for route in itertools.product(*(keys.positions(key) for key in order)):
+                cost, position, mask = 0, start, 0
+                for key, pos in zip(order, route):
+                    distance = bfs_distance(grid, position, pos, mask)
+                    if distance is None:
+                        break
+                    cost, position, mask = cost + distance, pos, mask | KEY_BITS[key]
+                else:
+                    distance = bfs_distance(grid, position, goal, mask)
+                    if distance is not None and (best is None or cost + distance < best):
+                        best = cost + distance
+        tour = tours.plan(start, goal, wanted, keys, ())
+        assert (tour[0] if tour else None) == best
+        if tour:
+            assert sorted(key for key, _ in tour[1]) == sorted(wanted)
@@ -0,0 +1,90 @@
+import pytest
+
+from P2_testing import run_case
+from replay import validate
+
+GRID = ['m.bB.g',
+        'WWWWW.',
+        'h.....']
+ACTIONS = ['Request: green', 'Move RIGHT', 'Request: blue', 'Request: red']
+
+
+def write_case(tmp_path, rows=GRID, actions=ACTIONS):
+    grid_file, actions_file = tmp_path / '1_grid.txt', tmp_path / '1_human.txt'
+    grid_file.write_text('\n'.join(rows) + '\n')
+    actions_file.write_text('\n'.join(actions) + '\n')
+    return str(grid_file), str(actions_file)
+
+
+@pytest.mark.parametrize('batch', [1, 2])
+def test_simulated_result_is_valid(tmp_path, batch):
+    grid_file, actions_file = write_case(tmp_path)
+    result_file = str(tmp_path / 'result.txt')
+    run_case(grid_file, actions_file, result_file, planner='astar', batch=batch, snapshot=False)
+    report = validate(grid_file, actions_file, result_file, batch)
+    assert report['valid'], report['error']
+    assert report['skipped'] == 0
+
+
+def check(tmp_path, lines, rows=GRID, actions=ACTIONS):
+    grid_file, actions_file = write_case(tmp_path, rows, actions)
+    result_file = tmp_path / 'result.txt'
+    result_file.write_text('\n'.join(lines) + '\n')
+    return validate(grid_file, actions_file, str(result_file))
+
+
+GREEN_TRIP = ['My_position (0, 0)', 'Move RIGHT (0, 1)', 'Move RIGHT (0, 2)', 'Pick_up_B_key',
+              'Move RIGHT (0, 3)', 'Move RIGHT (0, 4)', 'Move RIGHT (0, 5)', 'Pick_up_G_key',
+              'Locate_human: (2, 0)', 'Move_to_Human:', 'Move DOWN (1, 5)', 'Move DOWN (2, 5)',
+              'Move LEFT (2, 4)', 'Move LEFT (2, 3)', 'Move LEFT (2, 2)', 'Move LEFT (2, 1)',
+              'Move LEFT (2, 0)', 'Drop_G_key']
+
+
+def test_held_key_is_delivered_without_a_pickup(tmp_path):
+    report = check(tmp_path, GREEN_TRIP + ['Locate_human: (2, 1)', 'Move_to_Human:', 'Move RIGHT (2, 1)',
+                                           'Drop_B_key'])
+    assert report['valid'], report['error']
+    assert report['trips'] == [12, 1]
+
+
+def test_trip_must_start_where_the_last_one_ended(tmp_path):
+    # The agent jumps back to the green key instead of leaving from the human
+    report = check(tmp_path, GREEN_TRIP + ['Locate_human: (2, 1)', 'Move_to_Human:', 'Move DOWN (1, 5)',
+                                           'Drop_B_key'])
+    assert not report['valid']
+    assert ':21: agent is at (2, 0), so DOWN leads to (3, 0)' in report['error']
+
+
+def test_door_needs_its_key(tmp_path):
+    report = check(tmp_path, ['My_position (0, 0)', 'Move RIGHT (0, 1)', 'Move RIGHT (0, 2)', 'Move RIGHT (0, 3)'])
+    assert not report['valid']
+    assert "moved onto 'B'" in report['error']
+
+
+def test_unanswered_request_must_be_out_of_reach(tmp_path):
+    report = check(tmp_path, ['My_position (0, 0)'])
+    assert not report['valid']
+    assert 'no G key was brought' in report['error']
+
+    walled = ['m.W.g',
+              'WWWWW',
+              'h....']
+    report = check(tmp_path, ['My_position (0, 0)'], walled, ['Request: green'])
+    assert report['valid'], report['error']
+    assert report['skipped'] == 1
+
+
+# The first request cannot be served; the human then walks over the red door,
+# which clears it, so the same request can be served the second time. The trip
+# belongs to the second request, not to the first.
+def test_trip_after_skipped_request_of_same_color(tmp_path):
+    rows = ['m..W.y',
+            'h..R..']
+    actions = ['Request: yellow', 'Move RIGHT', 'Move RIGHT', 'Move RIGHT', 'Move LEFT', 'Request: yellow']
+    grid_file, actions_file = write_case(tmp_path, rows, actions)
+    result_file = str(tmp_path / 'result.txt')
+    run_case(grid_file, actions_file, result_file, snapshot=False)
+    report = validate(grid_file, actions_file, result_file)
+    assert report['valid'], report['error']
+    assert report['skipped'] == 1
+    assert len(report['trips']) == 1
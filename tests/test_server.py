@@ -0,0 +1,48 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import server
+from components import components_for
+from P2_testing import run_case
+
+# Unlocking the blue door edits the session's component labels and opens
+# the way to the green key
+GRID = ['m....',
+        'WWBWW',
+        'h...g']
+ACTIONS = ['Pick_up: blue', 'Unlock: blue', 'Request: green']
+
+
+def write_case(tmp_path):
+    grid_file, actions_file = tmp_path / '1_grid.txt', tmp_path / '1_human.txt'
+    grid_file.write_text('\n'.join(GRID) + '\n')
+    actions_file.write_text('\n'.join(ACTIONS) + '\n')
+    return str(grid_file), str(actions_file)
+
+
+# Sessions answer like a batch run and leave the shared state untouched
+@pytest.mark.parametrize('planner', ['astar', 'fields'])
+def test_sessions_match_batch_run(tmp_path, planner):
+    grid_file, actions_file = write_case(tmp_path)
+    run_case(grid_file, actions_file, str(tmp_path / 'result.txt'), planner=planner, snapshot=False)
+    expected = (tmp_path / 'result.txt').read_bytes()
+    shared = server.SharedGrid(grid_file, planner)
+    doors = dict(shared.components[4])
+    lines = [line.encode() + b'\n' for line in ACTIONS]
+
+    async def sessions():
+        with ThreadPoolExecutor() as pool:
+            listener = await asyncio.start_server(
+                lambda reader, writer: server.handle_session(shared, pool, reader, writer), '127.0.0.1', 0)
+            port = listener.sockets[0].getsockname()[1]
+            async with listener:
+                return await asyncio.gather(*(server.run_session('127.0.0.1', port, lines) for _ in range(3)))
+
+    for _, output in asyncio.run(sessions()):
+        assert output == expected
+    assert shared.components[4] == doors
+    assert b'Unlock_B_door' in expected and b'Drop_G_key' in expected
+    grid, agent_pos, human_pos, _, _ = shared.session()
+    assert not components_for(grid).reachable(agent_pos, human_pos, ())
@@ -0,0 +1,143 @@
+import io
+from array import array
+
+import pytest
+
+import P2_o1
+from actions import stream_actions
+from distances import wavefront
+from grid import Grid, locate
+from P2_testing import PLANNERS, find_closest_door, heuristic, simulate
+from sinks import TextSink
+from test_planners import open_cells, random_grid
+
+
+# Simulate an action script on a grid given as row strings; returns the result lines
+def run(rows, actions, planner='astar', batch=1):
+    grid, agent_pos, human_pos, keys = locate(Grid.from_rows(rows))
+    program = array('B')
+    for instruction in stream_actions(line.encode() for line in actions):
+        program.extend(instruction)
+    buffer = io.StringIO()
+    simulate(grid, agent_pos, human_pos, program, keys, None, PLANNERS[planner](grid),
+             TextSink(buffer, grid.stride), batch)
+    return buffer.getvalue().splitlines()
+
+
+# The blue door is in the way to the green key, so the blue key is picked up
+# on the way; the later request for blue is served from the key the agent holds
+DETOUR = ['m.bB.g',
+          'WWWWW.',
+          'h.....']
+
+
+@pytest.mark.parametrize('planner', sorted(PLANNERS))
+def test_detour_key_serves_later_request(planner):
+    lines = run(DETOUR, ['Request: green', 'Request: blue'], planner)
+    assert lines[:4] == ['My_position (0, 0)', 'Move RIGHT (0, 1)', 'Move RIGHT (0, 2)', 'Pick_up_B_key']
+    assert lines.count('Pick_up_B_key') == 1
+    assert lines.count('Drop_B_key') == 1
+    assert 'Drop_G_key' in lines
+    assert lines[-3:] == ['Locate_human: (2, 0)', 'Move_to_Human:', 'Drop_B_key']
+
+
+# Batched, both keys are fetched on one trip and dropped together
+def test_detour_key_in_batched_trip():
+    lines = run(DETOUR, ['Request: green', 'Request: blue'], batch=2)
+    assert lines.count('Locate_human: (2, 0)') == 1
+    assert lines[-2:] == ['Drop_B_key', 'Drop_G_key']
+
+
+# A key the agent cannot get to is neither picked up nor dropped
+@pytest.mark.parametrize('planner', sorted(PLANNERS))
+def test_unreachable_key_is_not_fetched(planner):
+    lines = run(['m.Wr',
+                 'WWWW',
+                 'h...'], ['Request: red'], planner)
+    assert lines == ['My_position (0, 0)']
+
+
+# The key can be fetched but not brought to the human: nothing is written either
+def test_undeliverable_key_is_not_fetched():
+    lines = run(['m.r',
+                 'WWW',
+                 'h..'], ['Request: red'])
+    assert lines == ['My_position (0, 0)']
+
+
+# The red key next to the agent is behind a wall; the one a step further
+# away is on the way to the human and is the one fetched
+@pytest.mark.parametrize('planner', sorted(PLANNERS))
+def test_request_fetches_cheapest_instance(planner):
+    lines = run(['m.Wr',
+                 '..W.',
+                 '..W.',
+                 '....',
+                 'r...',
+                 'h...'], ['Request: red'], planner)
+    assert lines == ['My_position (0, 0)', 'Move DOWN (1, 0)', 'Move DOWN (2, 0)', 'Move DOWN (3, 0)',
+                     'Move DOWN (4, 0)', 'Pick_up_R_key', 'Locate_human: (5, 0)', 'Move_to_Human:',
+                     'Move DOWN (5, 0)', 'Drop_R_key']
+
+
+# The nearest blue key is walled off; the other one is behind the green door,
+# so the green key is fetched on the way to it
+@pytest.mark.parametrize('planner', sorted(PLANNERS))
+def test_request_fetches_instance_behind_door(planner):
+    lines = run(['m...WWb',
+                 '....WWW',
+                 'g.WWW..',
+                 '..G..b.',
+                 'h.WWWWW'], ['Request: blue'], planner)
+    assert lines.count('Pick_up_G_key') == 1
+    assert lines.index('Pick_up_G_key') < lines.index('Pick_up_B_key')
+    assert lines[lines.index('Pick_up_B_key') - 1] == 'Move RIGHT (3, 5)'
+    assert lines[-1] == 'Drop_B_key'
+
+
+# Moves needed to step onto a door given a wavefront that stopped at it: one
+# more than its closest reached neighbor, None if no neighbor was reached
+def door_distance(grid, dist, idx):
+    reached = [dist[idx + step] for _, step in grid.moves if 0 <= idx + step < grid.size and dist[idx + step] >= 0]
+    return int(min(reached)) + 1 if reached else None
+
+
+# The door lookup must pick the door a full wavefront from the human would,
+# also once some doors have been unlocked
+@pytest.mark.parametrize('seed', range(20))
+def test_closest_door_matches_wavefront(seed):
+    grid, rng = random_grid(seed, walls=0.25, doors=0.1)
+    cells = open_cells(grid)
+    for unlock in [None] + rng.sample(grid.doors(), min(3, len(grid.doors()))):
+        if unlock is not None:
+            grid.set_cell(unlock, ord('.'))
+        doors = grid.doors()
+        for human_pos in rng.sample(cells, min(5, len(cells))):
+            for door in [None] + sorted({grid.cell(pos) for pos in doors}):
+                candidates = [pos for pos in doors if not door or grid.cell(pos) == door]
+                dist = wavefront(grid, [human_pos])
+                reachable = [(door_distance(grid, dist, pos), pos) for pos in candidates
+                             if door_distance(grid, dist, pos) is not None]
+                if reachable:
+                    expected = min(reachable)[1]
+                elif candidates:
+                    expected = min(candidates, key=lambda pos: heuristic(human_pos, pos, grid.stride))
+                else:
+                    expected = None
+                assert find_closest_door(human_pos, grid, door)[1] == expected
+
+
+# P2_o1 fetches the instance with the shortest path, not the one that is
+# nearest as the crow flies but behind a wall
+def test_o1_fetches_nearest_instance_by_path(tmp_path):
+    grid, agent_pos, human_pos, keys = locate(Grid.from_rows(['m.Wr.',
+                                                              '..W..',
+                                                              '.....',
+                                                              '.....',
+                                                              'r...h']))
+    result_file = tmp_path / 'result.txt'
+    P2_o1.simulate(grid, agent_pos, grid.pos(human_pos), [('Request', 'r')], keys, str(result_file))
+    lines = result_file.read_text().splitlines()
+    assert lines[:6] == ['My_position (0, 0)', 'Move DOWN (1, 0)', 'Move DOWN (2, 0)', 'Move DOWN (3, 0)',
+                         'Move DOWN (4, 0)', 'Pick_up_R_key']
+    assert lines[-1] == 'Drop_R_key'
@@ -0,0 +1,144 @@
+import os
+
+import pytest
+
+import snapshot
+from components import components_for
+from distances import DistanceCache
+from grid import KEY_COLORS, load_grid
+from P2_testing import run_case
+from test_planners import open_cells
+
+# The blue door keeps the agent from the human; the red door is locked for
+# good since there is no red key
+GRID = ['m..WWg',
+        '.b.Wr.',
+        'WWBWWR',
+        'y....W',
+        'h.WW.b']
+ACTIONS = ['Request: green', 'Pick_up: blue', 'Unlock: blue', 'Request: yellow']
+
+
+def write_case(tmp_path):
+    grid_file, actions_file = tmp_path / '1_grid.txt', tmp_path / '1_human.txt'
+    grid_file.write_text('\n'.join(GRID) + '\n')
+    actions_file.write_text('\n'.join(ACTIONS) + '\n')
+    return str(grid_file), str(actions_file)
+
+
+# Key sets of every combination of colors
+def key_sets():
+    return [[key for i, key in enumerate(KEY_COLORS) if mask & (1 << i)] for mask in range(16)]
+
+
+# A saved snapshot loads as the same grid, positions, keys, component
+# labels and distance fields as reading the grid file
+def test_snapshot_round_trip(tmp_path):
+    grid_file, _ = write_case(tmp_path)
+    snapshot.create(grid_file)
+    grid, agent_pos, human_pos, keys = load_grid(grid_file)
+    planner = DistanceCache(grid)
+    planner.precompute([agent_pos] + keys.instances() + grid.doors())
+
+    loaded, loaded_agent, loaded_human, loaded_keys, fields = snapshot.load_snapshot(snapshot.snapshot_path(grid_file))
+    assert (loaded.rows, loaded.cols, loaded.stride, loaded.size) == (grid.rows, grid.cols, grid.stride, grid.size)
+    assert bytes(loaded.cells[:loaded.size]) == bytes(grid.cells[:grid.size])
+    assert (loaded_agent, loaded_human) == (agent_pos, human_pos)
+    for key in KEY_COLORS:
+        assert sorted(loaded_keys.positions(key)) == sorted(keys.positions(key))
+
+    expected, restored = components_for(grid), components_for(loaded)
+    assert restored.doors == expected.doors
+    cells = open_cells(grid, 15)
+    for collected_keys in key_sets():
+        for start in cells:
+            for goal in cells:
+                assert restored.reachable(start, goal, collected_keys) == \
+                    expected.reachable(start, goal, collected_keys)
+
+    assert fields.keys() == planner.fields.keys()
+    for cache_key, field in planner.fields.items():
+        assert list(fields[cache_key].dist) == list(field.dist)
+        assert bytes(fields[cache_key].toward) == bytes(field.toward)
+        assert fields[cache_key].blocked == field.blocked
+        assert fields[cache_key].reached == field.reached
+
+
+# A snapshot is only used while the grid file is unchanged
+@pytest.mark.parametrize('change', ['contents', 'mtime'])
+def test_stale_snapshot_is_ignored(tmp_path, capsys, change):
+    grid_file, _ = write_case(tmp_path)
+    snapshot.create(grid_file)
+    assert snapshot.load_fresh(grid_file) is not None
+    if change == 'contents':
+        with open(grid_file, 'a') as file:
+            file.write('.....W\n')
+    else:
+        stat = os.stat(grid_file)
+        os.utime(grid_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert snapshot.load_fresh(grid_file) is None
+    assert 'is stale' in capsys.readouterr().err
+
+
+# Snapshots of another version or other files are refused
+@pytest.mark.parametrize('offset, data, message', [(4, (snapshot.VERSION + 1).to_bytes(4, 'little'), 'version'),
+                                                   (0, b'GHS0', 'not a grid snapshot')])
+def test_foreign_snapshot_is_refused(tmp_path, capsys, offset, data, message):
+    grid_file, _ = write_case(tmp_path)
+    snapshot.create(grid_file)
+    filename = snapshot.snapshot_path(grid_file)
+    with open(filename, 'r+b') as file:
+        file.seek(offset)
+        file.write(data)
+    with pytest.raises(ValueError, match=message):
+        snapshot.read_header(filename)
+    assert snapshot.load_fresh(grid_file) is None
+    assert message in capsys.readouterr().err
+
+
+# Cells of a restored grid are a private copy of the mapped file: unlocking
+# a door reaches the listeners and the component labels, and leaves the
+# snapshot as it was
+def test_unlock_after_restore(tmp_path):
+    grid_file, _ = write_case(tmp_path)
+    snapshot.create(grid_file)
+    filename = snapshot.snapshot_path(grid_file)
+    with open(filename, 'rb') as file:
+        saved = file.read()
+
+    grid, agent_pos, human_pos, keys, fields = snapshot.load_snapshot(filename)
+    components = components_for(grid)
+    planner = DistanceCache(grid)
+    planner.fields.update(fields)
+    changed = []
+    grid.listeners.append(changed.append)
+    door = grid.index((2, 2))
+    assert not components.reachable(agent_pos, human_pos, ())
+    assert planner.distance(agent_pos, human_pos, ()) is None
+
+    grid.set_cell(door, ord('.'))
+    assert changed == [door]
+    assert door not in components.doors
+    assert components.reachable(agent_pos, human_pos, ())
+    assert planner.distance(agent_pos, human_pos, ()) == 8
+    with open(filename, 'rb') as file:
+        assert file.read() == saved
+    again = snapshot.load_snapshot(filename)
+    assert again[0].cell(door) == 'B' and door in components_for(again[0]).doors
+
+
+# Runs that load a snapshot, saved with or without the distance fields,
+# write the same results as reading the grid file
+@pytest.mark.parametrize('planner', ['astar', 'fields'])
+def test_runs_from_snapshot_match(tmp_path, planner):
+    grid_file, actions_file = write_case(tmp_path)
+    expected, actual = str(tmp_path / 'expected.txt'), str(tmp_path / 'actual.txt')
+    run_case(grid_file, actions_file, expected, planner=planner, snapshot=False)
+    run_case(grid_file, actions_file, str(tmp_path / 'saved.txt'), planner=planner, save=True)
+    assert os.path.exists(snapshot.snapshot_path(grid_file))
+    run_case(grid_file, actions_file, actual, planner=planner)
+    with open(expected, 'rb') as file:
+        result = file.read()
+    assert b'Unlock_B_door' in result
+    with open(actual, 'rb') as file:
+        assert file.read() == result
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+
+from distances import wavefront
+from grid import KEY_BITS, key_mask
+
+# Instances of one key considered for a tour, nearest to the agent first
+MAX_CANDIDATES = 3
+# Tours needing more distance fields than this are planned greedily
+EXACT_FIELDS = 48
+# Cells of all the distance fields kept at once (4 bytes each); on large
+# grids this also lowers the number of fields an exact tour may use
+FIELD_CELLS = 1 << 22
+
+
+# Plans one trip that picks up several requested keys and then delivers
+# them all to the human, choosing both the order and which instance of each
+# key to fetch. Distances come from wavefronts cached per (source, key
+# mask) for the duration of one plan, where the mask only keeps the colors
+# of doors still on the grid. The least recently used fields are dropped to
+# stay within FIELD_CELLS.
+class TourPlanner:
+    def __init__(self, grid):
+        self.grid = grid
+        self.fields = OrderedDict()
+        self.max_fields = max(1, FIELD_CELLS // grid.size)
+        self.door_mask = 0
+
+    def field(self, source, mask):
+        mask &= self.door_mask
+        field = self.fields.get((source, mask))
+        if field is None:
+            keys = {key for key, bit in KEY_BITS.items() if mask & bit}
+            field = self.fields[(source, mask)] = wavefront(self.grid, [source], keys)
+            if len(self.fields) > self.max_fields:
+                self.fields.popitem(last=False)
+        self.fields.move_to_end((source, mask))
+        return field
+
+    def distance(self, start, goal, mask):
+        distance = self.field(start, mask)[goal]
+        return int(distance) if distance >= 0 else None
+
+    # Cheapest route from start through one instance of every wanted key
+    # (all different colors) to goal, as (cost, [(key, position), ...]), or
+    # None if some key cannot be fetched. Exact over the candidate
+    # instances when all the distance fields that needs can be kept, greedy
+    # otherwise.
+    def plan(self, start, goal, wanted, keys, collected_keys):
+        self.fields.clear()
+        self.door_mask = key_mask(self.grid.cell(pos).lower() for pos in self.grid.doors())
+        base = key_mask(collected_keys)
+
+        def nearness(pos):
+            distance = self.distance(start, pos, base)
+            return (0, distance) if distance is not None else (1, 0)
+
+        candidates = [sorted(keys.positions(key), key=nearness)[:MAX_CANDIDATES] for key in wanted]
+        fields = 1 + sum(map(len, candidates)) * 2 ** (len(wanted) - 1)
+        if fields <= min(EXACT_FIELDS, self.max_fields):
+            tour = self._exact(start, goal, wanted, candidates, base)
+        else:
+            tour = self._greedy(start, goal, wanted, candidates, base)
+        self.fields.clear()
+        return tour
+
+    # Dynamic programming over (keys fetched so far, last instance)
+    def _exact(self, start, goal, wanted, candidates, base):
+        layer = {}
+        for i, key in enumerate(wanted):
+            for pos in candidates[i]:
+                distance = self.distance(start, pos, base)
+                if distance is not None:
+                    layer[(1 << i, pos)] = (distance, [(key, pos)])
+        for _ in range(len(wanted) - 1):
+            next_layer = {}
+            for (fetched, pos), (cost, route) in layer.items():
+                mask = base
+                for key, _ in route:
+                    mask |= KEY_BITS[key]
+                for j, key in enumerate(wanted):
+                    if fetched & (1 << j):
+                        continue
+                    for other in candidates[j]:
+                        distance = self.distance(pos, other, mask)
+                        if distance is None:
+                            continue
+                        state = (fetched | (1 << j), other)
+                        if state not in next_layer or cost + distance < next_layer[state][0]:
+                            next_layer[state] = (cost + distance, route + [(key, other)])
+            layer = next_layer
+
+        full = base
+        for key in wanted:
+            full |= KEY_BITS[key]
+        best = None
+        for (_, pos), (cost, route) in layer.items():
+            # Walks are undirected, so one field from the goal covers every last stop
+            distance = self.distance(goal, pos, full)
+            if distance is not None and (best is None or cost + distance < best[0]):
+                best = (cost + distance, route)
+        return best
+
+    # Always fetch the nearest instance of any key still wanted
+    def _greedy(self, start, goal, wanted, candidates, base):
+        position, mask, cost, route = start, base, 0, []
+        remaining = list(range(len(wanted)))
+        while remaining:
+            best = None
+            for i in remaining:
+                for pos in candidates[i]:
+                    distance = self.distance(position, pos, mask)
+                    if distance is not None and (best is None or distance < best[0]):
+                        best = (distance, i, pos)
+            if best is None:
+                return None
+            distance, i, position = best
+            remaining.remove(i)
+            cost += distance
+            mask |= KEY_BITS[wanted[i]]
+            route.append((wanted[i], position))
+        distance = self.distance(position, goal, mask)
+        if distance is None:
+            return None
+        return cost + distance, route